@@ -10,8 +10,10 @@ import streamlit.components.v1 as components
 ROOT_DIR = Path(__file__).resolve().parents[1]
 sys.path.append(str(ROOT_DIR))
 
-from src.retrieval.retriever import retrieve
-from src.generation.llm import generate_answer
+from src.retrieval.retriever import get_retriever, normalize_query
+from src.generation.answer_cache import get_answer_cache
+from src.generation.context import build_context
+from src.generation.llm import stream_answer
 
 # --------------------------------------------------
 # Page config
@@ -23,40 +25,59 @@ st.set_page_config(
 )
 
 # --------------------------------------------------
-# Asset paths
+# Static assets
 # --------------------------------------------------
-ASSETS = Path(__file__).parent / "assets"
-BG_IMAGE = ASSETS / "hp_library.png"
-THEME_MUSIC = ASSETS / "theme.mp3"
-MAGIC_SOUND = ASSETS / "magic.mp3"
+# Served by Streamlit from app/static (server.enableStaticServing in
+# .streamlit/config.toml): pages reference URLs, the browser caches them.
+STATIC_DIR = Path(__file__).parent / "static"
+
+
+@st.cache_data
+def asset_url(name: str) -> str:
+    # "" when the file is missing
+    return f"app/static/{name}" if (STATIC_DIR / name).exists() else ""
+
+
+@st.cache_data
+def audio_data_url(name: str) -> str:
+    # Audio stays inline: Tornado-based Streamlit serves static files
+    # other than images / fonts / pdf / xml / json as text/plain with
+    # nosniff, which browsers will not play. "" when the file is missing
+    # (theme.mp3 is not shipped); encoded once per process.
+    path = STATIC_DIR / name
+    if not path.exists():
+        return ""
+    return f"data:audio/mpeg;base64,{base64.b64encode(path.read_bytes()).decode()}"
+
+
+BG_IMAGE = asset_url("hp_library.png")
+THEME_MUSIC = audio_data_url("theme.mp3")
+MAGIC_SOUND = audio_data_url("magic.mp3")
 
 # --------------------------------------------------
-# Helpers
+# Shared resources (once per server process)
 # --------------------------------------------------
-def load_base64(file_path: Path) -> str:
-    try:
-        if not file_path.exists():
-            return ""
-        return base64.b64encode(file_path.read_bytes()).decode()
-    except Exception:
-        return ""
+@st.cache_resource
+def load_retriever():
+    # Loads model / index / chunk store and runs one warm-up query
+    return get_retriever().warmup()
 
-bg_base64 = load_base64(BG_IMAGE)
-theme_base64 = load_base64(THEME_MUSIC)
-magic_base64 = load_base64(MAGIC_SOUND)
+
+@st.cache_resource
+def load_answer_cache():
+    return get_answer_cache()
 
 # --------------------------------------------------
 # 🎵 Background Music - Auto-play on page load
 # --------------------------------------------------
-def play_hidden_music(mp3_file):
-    with open(mp3_file, "rb") as f:
-        data = f.read()
-        b64 = base64.b64encode(data).decode()
-    
+def play_hidden_music(mp3_url):
+    if not mp3_url:
+        return
+
     components.html(
         f"""
         <audio id="bg-audio" loop>
-            <source src="data:audio/mp3;base64,{b64}" type="audio/mp3">
+            <source src="{mp3_url}" type="audio/mpeg">
         </audio>
         <script>
             const audio = document.getElementById('bg-audio');
@@ -84,7 +105,7 @@ st.markdown(
     @import url('https://fonts.googleapis.com/css2?family=Cinzel:wght@400;600;700&family=IM+Fell+English:ital@0;1&display=swap');
 
     .stApp {{
-        background-image: url("data:image/png;base64,{bg_base64}");
+        background-image: url("{BG_IMAGE}");
         background-size: cover;
         background-position: center;
         background-attachment: fixed;
@@ -283,6 +304,14 @@ with st.sidebar:
 st.markdown("<h1 class='main-title'>🪄 The Marauder's Knowledge Archive</h1>", unsafe_allow_html=True)
 st.markdown("<p class='subtitle'>I solemnly swear that I am up to no good.</p>", unsafe_allow_html=True)
 
+retriever = load_retriever()
+answer_cache = load_answer_cache()
+
+# Per-session memo: normalized query → (chunks, answer). Reruns caused by
+# other widgets re-render it without retrieval or generation.
+if "answers" not in st.session_state:
+    st.session_state.answers = {}
+
 query = st.text_input(
     "Ask a question",
     value=st.session_state.get("query", ""),
@@ -294,39 +323,56 @@ if "answer_count" not in st.session_state:
     st.session_state.answer_count = 0
 
 if query:
-    with st.spinner("🔮 Consulting the ancient texts..."):
-        try:
-            chunks = retrieve(query)
-            context = "\n\n".join(c["text"] for c in chunks)
-            answer = generate_answer(context, query)
-
+    try:
+        norm_query = normalize_query(query)
+        fresh = norm_query not in st.session_state.answers
+
+        if fresh:
+            with st.spinner("🔮 Consulting the ancient texts..."):
+                chunks = retriever.retrieve(query)
+                context = build_context(chunks)
+
+                # Repeated / near-duplicate questions skip generation
+                chunk_ids = [c["chunk_id"] for c in chunks]
+                query_vec = retriever.encode_cached([norm_query])[0]
+                answer = answer_cache.get(norm_query, chunk_ids, query_vec)
+
+            if answer is None:
+                # Deltas are shown as they arrive; the styled answer box below
+                # replaces them once the stream is complete
+                live = st.empty()
+                answer = live.write_stream(stream_answer(context, query)).strip()
+                live.empty()
+                answer_cache.put(norm_query, chunk_ids, answer, query_vec)
+
+            st.session_state.answers[norm_query] = (chunks, answer)
             st.session_state.answer_count += 1
-            answer_id = st.session_state.answer_count
-
-            import random
-            unique_key = random.randint(10000, 99999)
-
-            if magic_base64:
-                components.html(
-                    f"""
-                    <audio id="magic-sound-{answer_id}-{unique_key}" autoplay>
-                        <source src="data:audio/mpeg;base64,{magic_base64}">
-                    </audio>
-                    <script>
-                    (function() {{
-                        const magic = document.getElementById('magic-sound-{answer_id}-{unique_key}');
-                        if (magic) {{
-                            magic.volume = 0.6;
-                            magic.play().catch(e => console.log('Magic blocked'));
-                        }}
-                    }})();
-                    </script>
-                    """,
-                    height=0,
-                )
-
-            # 🌟 ANSWER BOX — fully visible + scrolls inside
+
+        chunks, answer = st.session_state.answers[norm_query]
+        answer_id = st.session_state.answer_count
+
+        # Only a new answer plays the sound, not a rerun of an old one
+        if fresh and MAGIC_SOUND:
             components.html(
+                f"""
+                <audio id="magic-sound-{answer_id}" autoplay>
+                    <source src="{MAGIC_SOUND}" type="audio/mpeg">
+                </audio>
+                <script>
+                (function() {{
+                    const magic = document.getElementById('magic-sound-{answer_id}');
+                    if (magic) {{
+                        magic.volume = 0.6;
+                        magic.play().catch(e => console.log('Magic blocked'));
+                    }}
+                }})();
+                </script>
+                """,
+                height=0,
+            )
+
+        # 🌟 ANSWER BOX — fully visible + scrolls inside
+        components.html(
     f"""
     <style>
     @import url('https://fonts.googleapis.com/css2?family=Cinzel:wght@400;600;700&family=IM+Fell+English:ital@0;1&display=swap');
@@ -415,23 +461,23 @@ if query:
 )
 
 
-            with st.expander("📚 View Source Excerpts"):
-                for i, chunk in enumerate(chunks[:3], 1):
-                    book = chunk.get("book", "Unknown Book")
-                    chapter = chunk.get("chapter", "Unknown Chapter")
-                    text_snippet = (chunk.get("text", "")[:250] + "...").strip()
+        with st.expander("📚 View Source Excerpts"):
+            for i, chunk in enumerate(chunks[:3], 1):
+                book = chunk.get("book", "Unknown Book")
+                chapter = chunk.get("chapter", "Unknown Chapter")
+                text_snippet = (chunk.get("text", "")[:250] + "...").strip()
 
-                    st.markdown(f"### 📖 Source {i}")
-                    st.markdown(f"**Book:** {book}")
-                    st.markdown(f"**Chapter:** {chapter}")
-                    st.caption(text_snippet)
+                st.markdown(f"### 📖 Source {i}")
+                st.markdown(f"**Book:** {book}")
+                st.markdown(f"**Chapter:** {chapter}")
+                st.caption(text_snippet)
 
-                    if i < len(chunks[:3]):
-                        st.divider()
+                if i < len(chunks[:3]):
+                    st.divider()
 
 
-        except Exception as e:
-            st.error(f"⚡ A spell went wrong: {e}")
+    except Exception as e:
+        st.error(f"⚡ A spell went wrong: {e}")
 
 else:
     st.markdown(
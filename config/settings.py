@@ -7,11 +7,29 @@ load_dotenv()
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 
 PDF_PATH = os.path.join(BASE_DIR, "data", "raw", "harrypotter.pdf")
+# A single PDF or a directory of PDFs (ingested in filename order)
+PDF_SOURCE = os.getenv("PDF_SOURCE", PDF_PATH)
 PROCESSED_DIR = os.path.join(BASE_DIR, "data", "processed")
 
 PAGES_PATH = os.path.join(PROCESSED_DIR, "pages.json")
+PAGES_JSONL_PATH = os.path.join(PROCESSED_DIR, "pages.jsonl")
+PAGES_CHECKPOINT_PATH = os.path.join(PROCESSED_DIR, "pages.checkpoint.jsonl")
+PAGES_MANIFEST_PATH = os.path.join(PROCESSED_DIR, "pages.manifest.json")
 CHUNKS_PATH = os.path.join(PROCESSED_DIR, "chunks.json")
+CHUNKS_JSONL_PATH = os.path.join(PROCESSED_DIR, "chunks.jsonl")
+CHUNK_STORE_DIR = os.path.join(PROCESSED_DIR, "chunk_store")
+CHUNK_IDS_PATH = os.path.join(PROCESSED_DIR, "chunk_ids.json")
+QUERY_CACHE_DIR = os.path.join(PROCESSED_DIR, "query_cache")
+BM25_DIR = os.path.join(PROCESSED_DIR, "bm25")
 FAISS_INDEX_PATH = os.path.join(PROCESSED_DIR, "index.faiss")
+FAISS_META_PATH = os.path.join(PROCESSED_DIR, "index.meta.json")
+FAISS_HASHES_PATH = os.path.join(PROCESSED_DIR, "index.hashes.npz")
+EMBED_CACHE_PATH = os.path.join(PROCESSED_DIR, "embeddings.sqlite")
+INDEX_REPORT_PATH = os.path.join(PROCESSED_DIR, "index_report.json")
+ANSWER_CACHE_PATH = os.path.join(PROCESSED_DIR, "answers.sqlite")
+EVAL_RESULTS_PATH = os.path.join(PROCESSED_DIR, "eval_answers.jsonl")
+METRICS_PATH = os.path.join(PROCESSED_DIR, "metrics.prom")
+EVAL_QUESTIONS_PATH = os.path.join(BASE_DIR, "evaluation", "eval_questions.json")
 
 # -------- Book order (image page → new book) --------
 BOOK_SEQUENCE = [
@@ -24,21 +42,124 @@ BOOK_SEQUENCE = [
     "Harry Potter and the Deathly Hallows",
 ]
 
+# -------- Ingestion --------
+# Processes used for page text extraction (1 = serial)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))
+# Pages per checkpointed extraction range (resume granularity)
+INGEST_CHECKPOINT_PAGES = 50
+# "json" (pages.json) or "jsonl" (pages.jsonl, streamed with flat memory)
+PAGES_FORMAT = os.getenv("PAGES_FORMAT", "json")
+
 # -------- Chunking --------
 NARRATIVE_CHUNK_SIZE = 400
 NARRATIVE_OVERLAP = 100
 POEM_MAX_LINES = 40
+# "words" (NARRATIVE_CHUNK_SIZE / NARRATIVE_OVERLAP) or "tokens"
+# (windows packed to the EMBED_MODEL max sequence length)
+CHUNKING_MODE = os.getenv("CHUNKING_MODE", "words")
+TOKEN_CHUNK_OVERLAP = 64
+# "json" (chunks.json) or "jsonl" (chunks.jsonl)
+CHUNKS_FORMAT = os.getenv("CHUNKS_FORMAT", "json")
 
 # -------- Embeddings --------
 EMBEDDING_PROVIDER = "sentence-transformers"
 EMBED_MODEL = "sentence-transformers/all-mpnet-base-v2"
+# New chunks encoded between embedding-cache commits
+EMBED_CHECKPOINT_SIZE = 1024
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 32))
+# Encoder processes for index builds (1 = in-process)
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", 1))
+
+# -------- Vector Index --------
+# "flat" (exact), "ivf_flat", "ivf_pq" or "hnsw"
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+# Stored vector precision: "float32", "float16" or "int8" (scalar quantized)
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")
+# Memory-map the index so worker processes share one page-cache copy
+INDEX_MMAP = os.getenv("INDEX_MMAP", "1") == "1"
+IVF_NLIST = 0              # 0 = 4 * sqrt(n_chunks)
+IVF_NPROBE = 16
+PQ_M = 48                  # sub-quantizers, must divide the embedding dim
+PQ_NBITS = 8
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+# HNSW scopes (book / chapter / pages) up to this fraction of the index
+# are scored exactly instead of walking the graph through a filter
+FILTER_EXACT_RATIO = float(os.getenv("FILTER_EXACT_RATIO", "0.1"))
+# Sampled chunk vectors added to the eval questions in the index report
+INDEX_REPORT_SAMPLES = 200
 
 # -------- Retrieval --------
 TOP_K = 8
+# LRU entries for query embeddings and for final retrieve() results
+QUERY_CACHE_SIZE = 1024
+QUERY_CACHE_PERSIST = os.getenv("QUERY_CACHE_PERSIST", "0") == "1"
+# Hybrid search: BM25 candidates fused with FAISS hits (reciprocal rank fusion)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Candidates taken from each channel before fusion
+HYBRID_CANDIDATES = 32
+RRF_K = 60
+
+# -------- Context Assembly --------
+# Prompt context budget for GEMINI_MODEL, estimated from character count
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))
+CONTEXT_CHARS_PER_TOKEN = 4
+# Shared words needed to treat two chunks as one continuous passage
+CONTEXT_MIN_OVERLAP = 8
+
+# -------- Answer Cache --------
+# Generated answers kept across restarts (0 disables the cache)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 2000))
+ANSWER_CACHE_TTL = 7 * 24 * 3600  # seconds
+# Query-embedding cosine above which a cached answer is reused
+ANSWER_CACHE_SIMILARITY = 0.95
+
+# -------- Answer Evaluation --------
+# Gemini quota: requests per minute shared by all eval workers
+EVAL_RPM = float(os.getenv("EVAL_RPM", 10))
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", 4))
+EVAL_MAX_RETRIES = 5
+EVAL_BACKOFF_BASE = 2.0  # seconds, doubled per retry
+EVAL_BACKOFF_MAX = 60.0
 
 # -------- LLM (Generation only) --------
-LLM_PROVIDER = "google-genai"
+# "google-genai" or "mock" (offline, see MOCK_LLM_* below)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "google-genai")
 GEMINI_MODEL = "models/gemini-2.5-flash"
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise RuntimeError("GEMINI_API_KEY not found in .env")
\ No newline at end of file
+
+# Mock provider: seconds before the first token, then tokens per second
+MOCK_LLM_LATENCY = float(os.getenv("MOCK_LLM_LATENCY", 0.5))
+MOCK_LLM_TOKENS_PER_S = float(os.getenv("MOCK_LLM_TOKENS_PER_S", 80))
+MOCK_LLM_ANSWER_TOKENS = 120
+
+# -------- HTTP Service --------
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", 8000))
+# Concurrent queries are grouped for up to BATCH_MAX_WAIT_MS / BATCH_MAX_SIZE
+BATCH_MAX_SIZE = 32
+BATCH_MAX_WAIT_MS = 5
+# Backpressure: queued queries / concurrent generations before 503s
+SERVICE_MAX_QUEUE = int(os.getenv("SERVICE_MAX_QUEUE", 256))
+SERVICE_MAX_GENERATIONS = int(os.getenv("SERVICE_MAX_GENERATIONS", 8))
+
+# -------- Tracing --------
+# Per-stage timing histograms (Prometheus text: GET /metrics, and
+# METRICS_PATH at exit). Off by default: spans are then no-ops.
+TRACING = os.getenv("TRACING", "0") == "1"
+# Also log every span as one JSON line
+TRACE_LOG_JSON = os.getenv("TRACE_LOG_JSON", "0") == "1"
+
+# -------- Load Test --------
+LOAD_REPORT_PATH = os.path.join(PROCESSED_DIR, "load_report.json")
+
+
+def require_gemini_api_key() -> str:
+    # Checked when generation is first used, not at import, so offline
+    # tools (ingestion, chunking, embedding, retrieval eval) need no key.
+    if not GEMINI_API_KEY:
+        raise RuntimeError("GEMINI_API_KEY not found in .env")
+    return GEMINI_API_KEY
@@ -50,45 +50,154 @@
 
 
 import json
+import os
+import threading
 import time
-from src.retrieval.retriever import retrieve
-from src.generation.llm import generate_answer
-
-MAX_QUESTIONS = 5
-
-def trim_context(chunks, max_chars=1800):
-    context = ""
-    for c in chunks:
-        text = c["text"].strip()
-        if len(context) + len(text) > max_chars:
-            break
-        context += text + "\n"
-    return context
-
-def evaluate_answers():
-    with open("evaluation/eval_questions.json", "r", encoding="utf-8") as f:
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config.settings import (
+    EVAL_QUESTIONS_PATH,
+    EVAL_RESULTS_PATH,
+    EVAL_RPM,
+    EVAL_CONCURRENCY,
+    EVAL_MAX_RETRIES,
+    EVAL_BACKOFF_BASE,
+    EVAL_BACKOFF_MAX
+)
+from src.retrieval.retriever import retrieve_many
+from src.generation.context import build_context
+from src.generation.llm import stream_answer
+from src.utils.rate_limit import TokenBucket, with_backoff
+
+# Small prompts keep the free tier's tokens-per-minute limit happy
+MAX_CONTEXT_TOKENS = 1000
+
+def timed_answer(context, question, client=None):
+    # Streams the answer; returns (answer, time to first token, total time)
+    start = time.perf_counter()
+    ttft = None
+    parts = []
+
+    for delta in stream_answer(context, question, client=client):
+        if ttft is None:
+            ttft = time.perf_counter() - start
+        parts.append(delta)
+
+    total = time.perf_counter() - start
+    return "".join(parts).strip(), ttft if ttft is not None else total, total
+
+def load_results(path):
+    # Latest record per question id; a torn last line is ignored
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            results[record["id"]] = record
+    return results
+
+def drop_torn_line(path):
+    # An interrupted write can leave a partial last line; the next
+    # append would otherwise be glued onto it
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+
+def evaluate_answers(
+    client=None,
+    results_path=EVAL_RESULTS_PATH,
+    rpm=EVAL_RPM,
+    workers=EVAL_CONCURRENCY,
+    questions_path=EVAL_QUESTIONS_PATH
+):
+    if rpm <= 0:
+        raise ValueError(f"EVAL_RPM must be > 0, got {rpm}")
+    # Shared quota: every request (retries included) takes a token
+    bucket = TokenBucket(rate=rpm / 60.0, capacity=1)
+
+    with open(questions_path, "r", encoding="utf-8") as f:
         data = json.load(f)
 
-    for idx, item in enumerate(data):
-        if idx == MAX_QUESTIONS:
-            print("🛑 Evaluation batch finished. Rerun to continue.")
-            break
+    # -------- Resume --------
+    done = {
+        qid for qid, r in load_results(results_path).items() if "error" not in r
+    }
+    todo = [item for item in data if item["id"] not in done]
+    print(f"📋 {len(data)} questions, {len(done)} already answered, {len(todo)} to run")
 
-        chunks = retrieve(item["question"])
-        context = trim_context(chunks)
+    if not todo:
+        return summarize(results_path)
 
-        try:
-            answer = generate_answer(context, item["question"])
-        except Exception as e:
-            print("⚠️ Gemini limit hit. Sleeping 20s...")
-            time.sleep(20)
-            answer = generate_answer(context, item["question"])
+    # Retrieval for the whole batch up front: one encode + one search
+    contexts = [
+        build_context(chunks, token_budget=MAX_CONTEXT_TOKENS)
+        for chunks in retrieve_many([item["question"] for item in todo])
+    ]
+
+    write_lock = threading.Lock()
+    os.makedirs(os.path.dirname(results_path) or ".", exist_ok=True)
+    drop_torn_line(results_path)
 
-        print(f"\n[{idx+1}] Q:", item["question"])
-        print("Expected:", item["answer"])
-        print("Model:", answer)
+    def attempt(item, context):
+        bucket.acquire()
+        return timed_answer(context, item["question"], client=client)
 
-        time.sleep(6)  # ⬅️ DO NOT REDUCE
+    def run_one(item, context):
+        record = {"id": item["id"], "question": item["question"], "expected": item["answer"]}
+        try:
+            answer, ttft, total = with_backoff(
+                lambda: attempt(item, context),
+                max_retries=EVAL_MAX_RETRIES,
+                base_delay=EVAL_BACKOFF_BASE,
+                max_delay=EVAL_BACKOFF_MAX
+            )
+            record.update({"answer": answer, "ttft_s": round(ttft, 3), "total_s": round(total, 3)})
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+
+        # Checkpoint: one line per finished question
+        with write_lock, open(results_path, "a", encoding="utf-8") as out:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+        return record
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_one, item, ctx) for item, ctx in zip(todo, contexts)]
+
+        for future in as_completed(futures):
+            r = future.result()
+            print(f"\n[Q{r['id']}] Q:", r["question"])
+            print("Expected:", r["expected"])
+            if "error" in r:
+                print("⚠️ Failed:", r["error"])
+            else:
+                print("Model:", r["answer"])
+                print(f"⏱️ TTFT: {r['ttft_s']:.2f}s | Total: {r['total_s']:.2f}s")
+
+    return summarize(results_path)
+
+def summarize(results_path):
+    results = list(load_results(results_path).values())
+    ok = [r for r in results if "error" not in r]
+
+    if ok:
+        print(
+            f"\n⏱️ Mean TTFT: {sum(r['ttft_s'] for r in ok) / len(ok):.2f}s | "
+            f"Mean total: {sum(r['total_s'] for r in ok) / len(ok):.2f}s"
+        )
+    print(f"✅ {len(ok)} answered, ⚠️ {len(results) - len(ok)} failed → {results_path}")
+    if len(results) > len(ok):
+        print("🔁 Rerun to retry the failed questions.")
+    return results
 
 if __name__ == "__main__":
     evaluate_answers()
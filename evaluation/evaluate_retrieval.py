@@ -1,5 +1,5 @@
 import json
-from src.retrieval.retriever import retrieve
+from src.retrieval.retriever import retrieve_many
 
 def evaluate_retrieval():
     with open("evaluation/eval_questions.json", "r", encoding="utf-8") as f:
@@ -8,8 +8,10 @@ def evaluate_retrieval():
     total = len(data)
     hit = 0
 
-    for item in data:
-        chunks = retrieve(item["question"])
+    # One batched encode + search for the whole question set
+    results = retrieve_many([item["question"] for item in data])
+
+    for item, chunks in zip(data, results):
         # context = " ".join(c["text"].lower() for c in chunks)
         context = " ".join(
                 (c["text"] + " " + " ".join(c.get("facts", []))).lower()
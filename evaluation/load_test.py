@@ -0,0 +1,122 @@
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from config.settings import (
+    EVAL_QUESTIONS_PATH,
+    LOAD_REPORT_PATH,
+    MOCK_LLM_LATENCY,
+    MOCK_LLM_TOKENS_PER_S
+)
+from src.retrieval.retriever import Retriever
+from src.generation.context import build_context
+from src.generation.llm import get_client, stream_answer
+from src.generation.mock_llm import MockClient
+
+STAGES = ["retrieve", "context", "ttft", "generate", "end_to_end"]
+
+def run_session(session_id, retriever, client, questions, requests, think_time, timings, lock):
+    rng = random.Random(session_id)
+
+    for _ in range(requests):
+        question = rng.choice(questions)
+        t0 = time.perf_counter()
+
+        chunks = retriever.retrieve(question)
+        t1 = time.perf_counter()
+
+        context = build_context(chunks)
+        t2 = time.perf_counter()
+
+        first = None
+        for _ in stream_answer(context, question, client=client):
+            if first is None:
+                first = time.perf_counter()
+        t3 = time.perf_counter()
+
+        with lock:
+            timings["retrieve"].append(t1 - t0)
+            timings["context"].append(t2 - t1)
+            timings["ttft"].append((first or t3) - t2)
+            timings["generate"].append(t3 - t2)
+            timings["end_to_end"].append(t3 - t0)
+
+        if think_time:
+            time.sleep(rng.uniform(0, 2 * think_time))
+
+def percentiles(values):
+    ms = np.asarray(values) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "mean_ms": round(float(ms.mean()), 2)
+    }
+
+def load_test(sessions, requests, think_time=0.0, client=None, cache=False):
+    with open(EVAL_QUESTIONS_PATH, "r", encoding="utf-8") as f:
+        questions = [item["question"] for item in json.load(f)]
+
+    retriever = Retriever()
+    if not cache:
+        # Every request pays for encode + search, as with distinct users
+        retriever.embedding_cache.max_size = 0
+        retriever.result_cache.max_size = 0
+    retriever.warmup()
+
+    client = client or get_client("mock")
+    timings = {stage: [] for stage in STAGES}
+    lock = threading.Lock()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        futures = [
+            pool.submit(run_session, i, retriever, client, questions, requests, think_time, timings, lock)
+            for i in range(sessions)
+        ]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    report = {
+        "sessions": sessions,
+        "requests": len(timings["end_to_end"]),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(timings["end_to_end"]) / elapsed, 2),
+        "stages": {stage: percentiles(values) for stage, values in timings.items()}
+    }
+
+    print(f"\n🚦 {sessions} sessions × {requests} requests in {elapsed:.1f}s "
+          f"→ {report['throughput_rps']} req/s")
+    print(f"{'stage':12s} {'p50':>10s} {'p95':>10s} {'p99':>10s}")
+    for stage, p in report["stages"].items():
+        print(f"{stage:12s} {p['p50_ms']:>8.1f}ms {p['p95_ms']:>8.1f}ms {p['p99_ms']:>8.1f}ms")
+
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline retrieval + generation load test")
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=10, help="requests per session")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between requests (s)")
+    parser.add_argument("--latency", type=float, default=MOCK_LLM_LATENCY, help="mock time to first token (s)")
+    parser.add_argument("--tokens-per-s", type=float, default=MOCK_LLM_TOKENS_PER_S)
+    parser.add_argument("--cache", action="store_true", help="keep the query caches on")
+    args = parser.parse_args()
+
+    report = load_test(
+        args.sessions,
+        args.requests,
+        think_time=args.think_time,
+        client=MockClient(latency=args.latency, tokens_per_s=args.tokens_per_s),
+        cache=args.cache
+    )
+
+    with open(LOAD_REPORT_PATH, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"📄 Report written to {LOAD_REPORT_PATH}")
@@ -1,14 +1,30 @@
+import hashlib
 import json
 import os
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
 
 from config.settings import (
     PAGES_PATH,
+    PAGES_JSONL_PATH,
+    PAGES_FORMAT,
     CHUNKS_PATH,
+    CHUNKS_JSONL_PATH,
+    CHUNKS_FORMAT,
     NARRATIVE_CHUNK_SIZE,
-    NARRATIVE_OVERLAP
+    NARRATIVE_OVERLAP,
+    CHUNKING_MODE,
+    TOKEN_CHUNK_OVERLAP,
+    EMBED_MODEL,
+    CHUNK_STORE_DIR,
+    CHUNK_IDS_PATH,
+    FAISS_HASHES_PATH
 )
 from src.utils.logger import get_logger
+from src.utils.records import iter_records, write_records
+from src.retrieval.chunk_store import ChunkStore, build_chunk_store
+from src.utils.tracing import span, traced
 
 logger = get_logger(__name__)
 
@@ -36,53 +52,95 @@ def sliding_window(words: List[str]) -> List[str]:
     return chunks
 
 
-def run():
-    if not os.path.exists(PAGES_PATH):
-        raise FileNotFoundError("pages.json not found. Run pdf_loader first.")
+# -------- Token-Aware Chunking --------
+_tokenizer = None
+_token_budget = None
+
+
+def load_tokenizer() -> Tuple[object, int]:
+    # The embedding model's own tokenizer and real sequence limit, so
+    # every window fills exactly one encoder pass with nothing truncated.
+    global _tokenizer, _token_budget
+
+    if _tokenizer is None:
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(EMBED_MODEL, device="cpu")
+        _tokenizer = model.tokenizer
+        _token_budget = (
+            model.max_seq_length
+            - _tokenizer.num_special_tokens_to_add(pair=False)
+        )
+        logger.info(
+            f"Token chunking: {_token_budget} tokens per window, "
+            f"{TOKEN_CHUNK_OVERLAP} overlap ({EMBED_MODEL})"
+        )
+
+    return _tokenizer, _token_budget
+
+
+def token_window(text: str) -> List[str]:
+    tokenizer, budget = load_tokenizer()
+
+    text = " ".join(text.split())
+    offsets = tokenizer(
+        text,
+        add_special_tokens=False,
+        return_offsets_mapping=True,
+        verbose=False
+    )["offset_mapping"]
 
-    with open(PAGES_PATH, "r", encoding="utf-8") as f:
-        pages = json.load(f)
+    # Windows only start / end where a token begins a new word
+    starts_word = [s == 0 or text[s - 1] == " " for s, _ in offsets]
+    n = len(offsets)
 
     chunks = []
-    chunk_id = 0
+    start = 0
 
-    current_book = None
-    current_chapter = None
-    chapter_id = -1
+    while start < n:
+        end = min(start + budget, n)
 
-    buffer_text = []
-    buffer_page_nos = []
+        if end < n:
+            cut = end
+            while cut > start + 1 and not starts_word[cut]:
+                cut -= 1
+            if starts_word[cut]:
+                end = cut
 
-    def flush_buffer():
-        nonlocal chunk_id
-        if not buffer_text:
-            return
+        chunks.append(text[offsets[start][0]:offsets[end - 1][1]])
 
-        text = "\n".join(buffer_text)
-        words = text.split()
+        if end >= n:
+            break
 
-        for chunk in sliding_window(words):
-            chunks.append({
-                "chunk_id": chunk_id,
-                "text": chunk,
-                "book": current_book,
-                "chapter": current_chapter,
-                "chapter_id": chapter_id,
-                "page_no": buffer_page_nos[0]
-            })
-            chunk_id += 1
+        start = max(end - TOKEN_CHUNK_OVERLAP, start + 1)
+        while start < end and not starts_word[start]:
+            start += 1
+
+    return chunks
+
+
+def split_narrative(text: str) -> List[str]:
+    if CHUNKING_MODE == "tokens":
+        return token_window(text)
+    return sliding_window(text.split())
 
-        buffer_text.clear()
-        buffer_page_nos.clear()
+
+# -------- Stage 1: Book / Chapter Change Detection --------
+def iter_chapter_pages(pages: Iterable[Dict]) -> Iterator[Dict]:
+    # Tags each page with its chapter_id and whether it opens a new
+    # chapter (the point where the narrative buffer must be flushed).
+    current_book = None
+    current_chapter = None
+    chapter_id = -1
 
     for page in pages:
         book = page["book"]
         chapter = page["chapter"]
-        text = page["text"]
+        boundary = False
 
         # -------- Book Change --------
         if book != current_book:
-            flush_buffer()
+            boundary = True
             current_book = book
             current_chapter = None
             chapter_id = -1
@@ -90,40 +148,199 @@ def run():
 
         # -------- Chapter Change --------
         if chapter != current_chapter:
-            flush_buffer()
+            boundary = True
             current_chapter = chapter
             chapter_id += 1
             logger.info(
                 f"Chunking chapter {chapter_id}: {current_chapter}"
             )
 
+        yield {**page, "chapter_id": chapter_id, "boundary": boundary}
+
+
+# -------- Stage 2: Poem / Narrative Blocks --------
+def block_meta(page: Dict) -> Dict:
+    return {
+        "book": page["book"],
+        "chapter": page["chapter"],
+        "chapter_id": page["chapter_id"],
+        "page_no": page["page_no"]
+    }
+
+
+def iter_blocks(pages: Iterable[Dict]) -> Iterator[Dict]:
+    # Only the current chapter's narrative pages are buffered.
+    buffer_text = []
+    head: Optional[Dict] = None
+
+    def flush():
+        nonlocal head
+        if not buffer_text:
+            return None
+
+        block = {**head, "kind": "narrative", "text": "\n".join(buffer_text)}
+        buffer_text.clear()
+        head = None
+        return block
+
+    for page in pages:
+        if page["boundary"]:
+            block = flush()
+            if block:
+                yield block
+
         # -------- Poem Handling (NO windowing) --------
-        if is_poem(text):
-            flush_buffer()
-            chunks.append({
+        if is_poem(page["text"]):
+            block = flush()
+            if block:
+                yield block
+            yield {**block_meta(page), "kind": "poem", "text": page["text"]}
+            continue
+
+        # -------- Narrative Buffer --------
+        if head is None:
+            head = block_meta(page)
+        buffer_text.append(page["text"])
+
+    block = flush()
+    if block:
+        yield block
+
+
+# -------- Stage 3: Chunks --------
+def iter_chunks(blocks: Iterable[Dict]) -> Iterator[Dict]:
+    chunk_id = 0
+
+    for block in blocks:
+        if block["kind"] == "poem":
+            texts = [block["text"]]
+        else:
+            texts = split_narrative(block["text"])
+
+        for text in texts:
+            yield {
                 "chunk_id": chunk_id,
                 "text": text,
-                "book": current_book,
-                "chapter": current_chapter,
-                "chapter_id": chapter_id,
-                "page_no": page["page_no"]
-            })
+                "book": block["book"],
+                "chapter": block["chapter"],
+                "chapter_id": block["chapter_id"],
+                "page_no": block["page_no"]
+            }
             chunk_id += 1
-            continue
 
-        # -------- Narrative Buffer --------
-        buffer_text.append(text)
-        buffer_page_nos.append(page["page_no"])
 
-    flush_buffer()
+# -------- Stable Chunk IDs --------
+def text_key(text: str) -> bytes:
+    return hashlib.sha1(text.encode("utf-8")).digest()
 
-    with open(CHUNKS_PATH, "w", encoding="utf-8") as f:
-        json.dump(chunks, f, indent=2, ensure_ascii=False)
 
-    logger.info(f"Chunking completed: {len(chunks)} chunks created")
+def load_id_watermark(path: str = CHUNK_IDS_PATH) -> int:
+    if not os.path.exists(path):
+        return 0
+    with open(path, "r", encoding="utf-8") as f:
+        return int(json.load(f)["next_id"])
 
 
-if __name__ == "__main__":
-    run()
+def save_id_watermark(next_id: int, path: str = CHUNK_IDS_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"next_id": next_id}, f)
+    os.replace(path + ".tmp", path)
+
+
+def indexed_next_id(hashes_path: str = FAISS_HASHES_PATH) -> int:
+    # Ids that have a vector in the FAISS index (recorded by the embedder)
+    if not os.path.exists(hashes_path):
+        return 0
+    with np.load(hashes_path) as data:
+        ids = data["ids"]
+    return int(ids.max()) + 1 if ids.size else 0
+
+
+def previous_chunk_ids(
+    store_dir: str = CHUNK_STORE_DIR,
+    ids_path: str = CHUNK_IDS_PATH,
+    hashes_path: str = FAISS_HASHES_PATH
+) -> Tuple[Dict[bytes, List[int]], int]:
+    # Ids handed out by the last run, keyed by chunk text. A vector only
+    # depends on the text, so an unchanged chunk keeps its id (and its
+    # FAISS entry) even when the chunks around it move.
+    # New ids start past every id ever handed out or embedded, so a
+    # dropped id is not reused even if the store is missing or outdated.
+    next_id = max(load_id_watermark(ids_path), indexed_next_id(hashes_path))
+    if not ChunkStore.exists(store_dir):
+        return {}, next_id
 
+    store = ChunkStore(store_dir)
+    by_text: Dict[bytes, List[int]] = {}
+    for row in range(len(store)):
+        by_text.setdefault(text_key(store.get_text(row)), []).append(
+            int(store.chunk_id[row])
+        )
 
+    if len(store):
+        next_id = max(next_id, int(store.id_sorted[-1]) + 1)
+    return by_text, next_id
+
+
+def assign_stable_ids(
+    chunks: Iterable[Dict],
+    by_text: Dict[bytes, List[int]],
+    next_id: int
+) -> Iterator[Dict]:
+    reused = 0
+
+    for chunk in chunks:
+        ids = by_text.get(text_key(chunk["text"]))
+        if ids:
+            chunk["chunk_id"] = ids.pop(0)
+            reused += 1
+        else:
+            # Ids are never recycled: a new id always means new text
+            chunk["chunk_id"] = next_id
+            next_id += 1
+        yield chunk
+
+    logger.info(f"Stable ids: {reused} chunks kept their previous id")
+
+
+def stream_chunks(pages_path: Optional[str] = None) -> Iterator[Dict]:
+    # Lazy end-to-end pipeline: pages file → chunks, one at a time.
+    # Consumers (writer, embedder) pull from it directly.
+    pages_path = pages_path or (
+        PAGES_JSONL_PATH if PAGES_FORMAT == "jsonl" else PAGES_PATH
+    )
+
+    if not os.path.exists(pages_path):
+        raise FileNotFoundError(
+            f"{os.path.basename(pages_path)} not found. Run pdf_loader first."
+        )
+
+    pages = iter_records(pages_path)
+    return iter_chunks(iter_blocks(iter_chapter_pages(pages)))
+
+
+@traced("chunk.total")
+def run():
+    chunks_path = CHUNKS_JSONL_PATH if CHUNKS_FORMAT == "jsonl" else CHUNKS_PATH
+
+    by_text, next_id = previous_chunk_ids()
+    chunks = assign_stable_ids(stream_chunks(), by_text, next_id)
+
+    # Chunks are generated lazily, so this covers chunking + writing
+    with span("chunk.write"):
+        count = write_records(chunks, chunks_path)
+    logger.info(f"Chunking completed: {count} chunks created")
+
+    with span("chunk.store"):
+        build_chunk_store(iter_records(chunks_path))
+
+    # High-water mark outlives the store (rebuilds, STORE_VERSION bumps)
+    store = ChunkStore(CHUNK_STORE_DIR)
+    if len(store):
+        next_id = max(next_id, int(store.id_sorted[-1]) + 1)
+    save_id_watermark(next_id)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,74 @@
+import hashlib
+import os
+import sqlite3
+from typing import Dict, List
+
+import numpy as np
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# SQLite caps the number of bound parameters per statement
+LOOKUP_BATCH = 500
+
+
+class EmbeddingCache:
+    # Persistent, content-addressed vector cache:
+    #   key = sha256(model name, normalization flag, chunk text)
+    # Every put is committed, so an interrupted run keeps its progress.
+
+    def __init__(self, path: str, model_name: str, normalize: bool):
+        self.path = path
+        self.model_name = model_name
+        self.normalize = normalize
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " dim INTEGER NOT NULL,"
+            " vector BLOB NOT NULL)"
+        )
+        self.conn.commit()
+
+    def key(self, text: str) -> str:
+        h = hashlib.sha256()
+        h.update(self.model_name.encode("utf-8"))
+        h.update(b"\0norm=1\0" if self.normalize else b"\0norm=0\0")
+        h.update(text.encode("utf-8"))
+        return h.hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        unique = list(dict.fromkeys(keys))
+
+        for i in range(0, len(unique), LOOKUP_BATCH):
+            batch = unique[i:i + LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT key, dim, vector FROM embeddings WHERE key IN ({placeholders})",
+                batch
+            )
+            for key, dim, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32, count=dim)
+
+        return found
+
+    def put_many(self, keys: List[str], vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, dim, vector) VALUES (?, ?, ?)",
+            (
+                (key, int(vec.shape[0]), vec.tobytes())
+                for key, vec in zip(keys, vectors)
+            )
+        )
+        self.conn.commit()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
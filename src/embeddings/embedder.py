@@ -1,34 +1,253 @@
 import json
+import os
 import numpy as np
 import faiss
 from sentence_transformers import SentenceTransformer
+from typing import Dict, List, Optional, Tuple
 
 from config.settings import (
     CHUNKS_PATH,
+    CHUNKS_JSONL_PATH,
+    CHUNKS_FORMAT,
     FAISS_INDEX_PATH,
-    EMBED_MODEL
+    FAISS_META_PATH,
+    FAISS_HASHES_PATH,
+    EMBED_MODEL,
+    EMBED_CACHE_PATH,
+    EMBED_CHECKPOINT_SIZE,
+    EMBED_BATCH_SIZE,
+    EMBED_WORKERS,
+    INDEX_TYPE,
+    VECTOR_DTYPE
 )
+from src.chunking.chunker import text_key
+from src.embeddings.cache import EmbeddingCache
+from src.embeddings.index_builder import build_index, index_ids
+from src.retrieval.bm25 import build_bm25
+from src.utils.logger import get_logger
+from src.utils.records import iter_records
+from src.utils.tracing import span, traced
+
+logger = get_logger(__name__)
+
+
+# -------- Encoding Engine --------
+def token_lengths(model: SentenceTransformer, texts: List[str]) -> List[int]:
+    encoded = model.tokenizer(
+        texts,
+        add_special_tokens=True,
+        truncation=True,
+        max_length=model.max_seq_length,
+        verbose=False
+    )
+    return [len(ids) for ids in encoded["input_ids"]]
 
-def run():
-    with open(CHUNKS_PATH, "r", encoding="utf-8") as f:
-        chunks = json.load(f)
 
-    texts = [c["text"] for c in chunks]
+def encode_batch(model: SentenceTransformer, texts: List[str], normalize: bool, pool=None) -> np.ndarray:
+    if pool is not None:
+        return model.encode_multi_process(
+            texts,
+            pool,
+            batch_size=EMBED_BATCH_SIZE,
+            normalize_embeddings=normalize
+        )
 
-    model = SentenceTransformer(EMBED_MODEL)
-    vectors = model.encode(
+    return model.encode(
         texts,
-        batch_size=32,
+        batch_size=EMBED_BATCH_SIZE,
         show_progress_bar=True,
         convert_to_numpy=True,
-        normalize_embeddings=True
+        normalize_embeddings=normalize
+    )
+
+
+def embed_texts(texts: List[str], cache: EmbeddingCache) -> np.ndarray:
+    if not texts:
+        # np.stack needs at least one vector
+        dim = SentenceTransformer(EMBED_MODEL).get_sentence_embedding_dimension()
+        return np.empty((0, dim), dtype="float32")
+
+    keys = [cache.key(t) for t in texts]
+    found = cache.get_many(keys)
+
+    # Identical texts are encoded once
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in missing:
+            missing[key] = text
+
+    logger.info(
+        f"Embedding cache: {len(texts) - len(missing)} reused, "
+        f"{len(missing)} to encode"
+    )
+
+    if missing:
+        model = SentenceTransformer(EMBED_MODEL)
+        todo = list(missing.items())
+
+        # Length-bucketed order: poems and full windows never share a
+        # batch, so padding stays minimal. Vectors are matched back by
+        # key, so the returned matrix keeps corpus order.
+        lengths = token_lengths(model, [text for _, text in todo])
+        todo = [todo[i] for i in np.argsort(lengths, kind="stable")]
+
+        pool = None
+        if EMBED_WORKERS > 1:
+            pool = model.start_multi_process_pool(["cpu"] * EMBED_WORKERS)
+            logger.info(f"Encoding with {EMBED_WORKERS} worker processes")
+
+        try:
+            # Encode in slices, committing each one: an interrupted run
+            # resumes from the last finished slice.
+            for start in range(0, len(todo), EMBED_CHECKPOINT_SIZE):
+                batch = todo[start:start + EMBED_CHECKPOINT_SIZE]
+                with span("embed.encode"):
+                    vectors = encode_batch(
+                        model,
+                        [text for _, text in batch],
+                        normalize=cache.normalize,
+                        pool=pool
+                    )
+                cache.put_many([key for key, _ in batch], vectors)
+                found.update(zip((key for key, _ in batch), vectors))
+
+                logger.info(
+                    f"Encoded {min(start + EMBED_CHECKPOINT_SIZE, len(todo))}"
+                    f"/{len(todo)} new chunks"
+                )
+        finally:
+            if pool is not None:
+                model.stop_multi_process_pool(pool)
+
+    return np.stack([found[key] for key in keys]).astype("float32")
+
+
+# -------- Index Build / Incremental Update --------
+def index_signature() -> Dict:
+    return {
+        "model": EMBED_MODEL,
+        "index_type": INDEX_TYPE,
+        "vector_dtype": VECTOR_DTYPE
+    }
+
+
+def text_hashes(texts: List[str]) -> np.ndarray:
+    return np.array([text_key(t) for t in texts], dtype="S20")
+
+
+def load_index_hashes() -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    # Text hash of every vector in index.faiss, by id
+    if not os.path.exists(FAISS_HASHES_PATH):
+        return None
+    with np.load(FAISS_HASHES_PATH) as data:
+        return data["ids"], data["hashes"]
+
+
+def save_index_hashes(ids: np.ndarray, hashes: np.ndarray):
+    temp_path = FAISS_HASHES_PATH + ".tmp"
+    with open(temp_path, "wb") as f:
+        np.savez(f, ids=ids, hashes=hashes)
+    os.replace(temp_path, FAISS_HASHES_PATH)
+
+
+def load_existing_index() -> Optional[faiss.Index]:
+    # Only an ID-mapped index built with the current settings can be
+    # patched in place; anything else is rebuilt.
+    if not (os.path.exists(FAISS_INDEX_PATH) and os.path.exists(FAISS_META_PATH)):
+        return None
+
+    with open(FAISS_META_PATH, "r", encoding="utf-8") as f:
+        if json.load(f) != index_signature():
+            logger.info("Index settings changed, rebuilding")
+            return None
+
+    index = faiss.read_index(FAISS_INDEX_PATH)
+    return index if index_ids(index) is not None else None
+
+
+def update_index(
+    index: faiss.Index,
+    ids: np.ndarray,
+    hashes: np.ndarray,
+    texts: List[str],
+    cache: EmbeddingCache
+) -> bool:
+    current = index_ids(index)
+
+    indexed = load_index_hashes()
+    if indexed is None or not np.array_equal(np.sort(indexed[0]), np.sort(current)):
+        logger.info("Index text hashes missing or stale, rebuilding")
+        return False
+
+    # An id whose text changed (e.g. reused after its chunk was dropped)
+    # is replaced: its old vector belongs to another text.
+    old_hash = dict(zip(indexed[0].tolist(), indexed[1].tolist()))
+    changed = np.array(
+        [old_hash.get(i, h) != h for i, h in zip(ids.tolist(), hashes.tolist())],
+        dtype=bool
+    )
+
+    to_remove = np.union1d(np.setdiff1d(current, ids), ids[changed])
+    add_mask = ~np.isin(ids, current) | changed
+
+    if to_remove.size:
+        try:
+            index.remove_ids(to_remove)
+        except RuntimeError:
+            logger.info(f"{INDEX_TYPE} index does not support removal, rebuilding")
+            return False
+
+    if add_mask.any():
+        vectors = embed_texts([texts[i] for i in np.flatnonzero(add_mask)], cache)
+        index.add_with_ids(vectors, ids[add_mask])
+
+    logger.info(
+        f"Incremental index update: +{int(add_mask.sum())} "
+        f"-{to_remove.size} vectors ({int(changed.sum())} replaced)"
     )
+    return True
+
+
+@traced("embed.total")
+def run():
+    chunks_path = CHUNKS_JSONL_PATH if CHUNKS_FORMAT == "jsonl" else CHUNKS_PATH
+
+    # Only ids and texts are kept; chunk dicts are streamed and dropped
+    ids, texts = [], []
+    for c in iter_records(chunks_path):
+        ids.append(c["chunk_id"])
+        texts.append(c["text"])
+    ids = np.asarray(ids, dtype="int64")
+    hashes = text_hashes(texts)
+
+    cache = EmbeddingCache(EMBED_CACHE_PATH, EMBED_MODEL, normalize=True)
+    try:
+        index = load_existing_index()
+        if index is None or not update_index(index, ids, hashes, texts, cache):
+            vectors = embed_texts(texts, cache)
+            with span("embed.index"):
+                index = build_index(vectors, INDEX_TYPE, ids=ids)
+    finally:
+        cache.close()
 
-    dim = vectors.shape[1]
-    index = faiss.IndexFlatIP(dim)  # cosine similarity
-    index.add(vectors.astype("float32"))
+    # Lexical channel for hybrid search; written before index.faiss,
+    # whose replacement invalidates the retriever's result cache.
+    with span("embed.bm25"):
+        build_bm25(ids, texts)
 
-    faiss.write_index(index, FAISS_INDEX_PATH)
+    with span("embed.write"):
+        temp_path = FAISS_INDEX_PATH + ".tmp"
+        faiss.write_index(index, temp_path)
+        os.replace(temp_path, FAISS_INDEX_PATH)
+        save_index_hashes(ids, hashes)
+
+    with open(FAISS_META_PATH, "w", encoding="utf-8") as f:
+        json.dump(index_signature(), f, indent=2)
+
+    logger.info(
+        f"FAISS {INDEX_TYPE} index written to {FAISS_INDEX_PATH} "
+        f"({index.ntotal} vectors)"
+    )
 
 if __name__ == "__main__":
     run()
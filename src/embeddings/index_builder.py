@@ -0,0 +1,384 @@
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from config.settings import (
+    CHUNKS_PATH,
+    CHUNKS_JSONL_PATH,
+    CHUNKS_FORMAT,
+    EMBED_MODEL,
+    EMBED_CACHE_PATH,
+    EVAL_QUESTIONS_PATH,
+    INDEX_TYPE,
+    INDEX_MMAP,
+    VECTOR_DTYPE,
+    INDEX_REPORT_PATH,
+    INDEX_REPORT_SAMPLES,
+    IVF_NLIST,
+    IVF_NPROBE,
+    PQ_M,
+    PQ_NBITS,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+    FILTER_EXACT_RATIO,
+    TOP_K
+)
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+INDEX_TYPES = ["flat", "ivf_flat", "ivf_pq", "hnsw"]
+
+# Vector storage → faiss scalar quantizer (None = raw float32)
+VECTOR_DTYPES = {
+    "float32": None,
+    "float16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+# faiss recommends ~39 training points per IVF list / PQ centroid
+MIN_POINTS_PER_CENTROID = 39
+
+
+# -------- Index Construction --------
+def ivf_nlist(n: int) -> int:
+    nlist = IVF_NLIST or int(4 * np.sqrt(n))
+    return max(1, min(nlist, n // MIN_POINTS_PER_CENTROID))
+
+
+def build_index(
+    vectors: np.ndarray,
+    index_type: str = INDEX_TYPE,
+    vector_dtype: str = VECTOR_DTYPE,
+    ids: Optional[np.ndarray] = None
+) -> faiss.Index:
+    n, dim = vectors.shape
+
+    if vector_dtype not in VECTOR_DTYPES:
+        raise ValueError(
+            f"Unknown VECTOR_DTYPE '{vector_dtype}' "
+            f"(expected one of {list(VECTOR_DTYPES)})"
+        )
+    qtype = VECTOR_DTYPES[vector_dtype]
+
+    if index_type == "flat" and qtype is None:
+        index = faiss.IndexFlatIP(dim)  # cosine similarity
+
+    elif index_type == "flat":
+        index = faiss.IndexScalarQuantizer(
+            dim, qtype, faiss.METRIC_INNER_PRODUCT
+        )
+
+    elif index_type == "ivf_flat" and qtype is None:
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFFlat(
+            quantizer, dim, ivf_nlist(n), faiss.METRIC_INNER_PRODUCT
+        )
+
+    elif index_type == "ivf_flat":
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFScalarQuantizer(
+            quantizer, dim, ivf_nlist(n), qtype, faiss.METRIC_INNER_PRODUCT
+        )
+
+    elif index_type == "ivf_pq":
+        # PQ codes are already compressed: VECTOR_DTYPE does not apply
+        if dim % PQ_M:
+            raise ValueError(f"PQ_M={PQ_M} must divide embedding dim {dim}")
+        nbits = PQ_NBITS
+        # Small corpora cannot train 2^nbits centroids per sub-quantizer
+        while nbits > 1 and n < MIN_POINTS_PER_CENTROID * (1 << nbits):
+            nbits -= 1
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(
+            quantizer, dim, ivf_nlist(n), PQ_M, nbits,
+            faiss.METRIC_INNER_PRODUCT
+        )
+
+    elif index_type == "hnsw":
+        if qtype is None:
+            index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexHNSWSQ(
+                dim, qtype, HNSW_M, faiss.METRIC_INNER_PRODUCT
+            )
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+
+    else:
+        raise ValueError(
+            f"Unknown INDEX_TYPE '{index_type}' (expected one of {INDEX_TYPES})"
+        )
+
+    if ids is not None:
+        # Keyed by chunk_id, so rows can be added / removed in place
+        index = faiss.IndexIDMap2(index)
+
+    if not index.is_trained:
+        index.train(vectors)
+
+    if ids is not None:
+        index.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+    else:
+        index.add(vectors)
+
+    apply_search_params(index)
+    return index
+
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def index_ids(index: faiss.Index) -> Optional[np.ndarray]:
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.vector_to_array(index.id_map)
+    return None
+
+
+def apply_search_params(index: faiss.Index):
+    # Query-time knobs; also re-applied after faiss.read_index so
+    # settings changes take effect without rebuilding.
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(IVF_NPROBE, ivf.nlist)
+
+    hnsw = getattr(base_index(index), "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = max(HNSW_EF_SEARCH, TOP_K)
+
+
+def filtered_search_params(index: faiss.Index, selector: faiss.IDSelector) -> faiss.SearchParameters:
+    # Drops non-members while searching instead of post-filtering a
+    # top-K. IVF still only probes `nprobe` lists and HNSW only reaches
+    # what its graph walk finds, so scoped_search handles those.
+    # The caller keeps `selector` alive for the duration of the search.
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+
+    hnsw = getattr(base_index(index), "hnsw", None)
+    if hnsw is not None:
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=hnsw.efSearch)
+
+    return faiss.SearchParameters(sel=selector)
+
+
+def pad_labels(labels: np.ndarray, k: int) -> np.ndarray:
+    # Same shape as index.search: missing results are -1
+    if labels.shape[1] >= k:
+        return labels[:, :k]
+    pad = np.full((labels.shape[0], k - labels.shape[1]), -1, dtype=np.int64)
+    return np.hstack([labels, pad])
+
+
+def exact_scope_search(index: faiss.Index, q_vecs: np.ndarray, k: int, allowed: np.ndarray) -> np.ndarray:
+    # Brute force over the scope's own vectors: exact whatever the index
+    vectors = index.reconstruct_batch(allowed)
+    scores = q_vecs @ vectors.T
+    top = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    return pad_labels(allowed[top], k)
+
+
+def ivf_scope_search(
+    index: faiss.Index,
+    ids: np.ndarray,
+    q_vecs: np.ndarray,
+    k: int,
+    allowed: np.ndarray
+) -> np.ndarray:
+    # Probes exactly the inverted lists that hold scope vectors (whatever
+    # nprobe is), restricted to the scope's inner ids. Needs the direct
+    # map built by read_index.
+    ivf = faiss.try_extract_index_ivf(index)
+    inner = np.flatnonzero(np.isin(ids, allowed)).astype(np.int64)
+    if not inner.size:
+        return np.full((len(q_vecs), k), -1, dtype=np.int64)
+
+    list_of = faiss.vector_to_array(ivf.direct_map.array)[inner] >> 32
+    lists = np.unique(list_of).astype(np.int64)
+
+    q_vecs = np.ascontiguousarray(q_vecs, dtype="float32")
+    assign = np.ascontiguousarray(np.tile(lists, (len(q_vecs), 1)))
+    centroids = ivf.quantizer.reconstruct_batch(lists)
+    centroid_dis = np.ascontiguousarray(q_vecs @ centroids.T, dtype="float32")
+
+    distances = np.empty((len(q_vecs), k), dtype="float32")
+    labels = np.empty((len(q_vecs), k), dtype=np.int64)
+    selector = faiss.IDSelectorBatch(inner)
+    params = faiss.SearchParametersIVF(sel=selector, nprobe=len(lists))
+
+    # The numpy wrapper of search_preassigned does not take params
+    ivf.search_preassigned_c(
+        len(q_vecs), faiss.swig_ptr(q_vecs), k,
+        faiss.swig_ptr(assign), faiss.swig_ptr(centroid_dis),
+        faiss.swig_ptr(distances), faiss.swig_ptr(labels),
+        False, params
+    )
+    return np.where(labels >= 0, ids[np.maximum(labels, 0)], -1)
+
+
+def scoped_search(index: faiss.Index, q_vecs: np.ndarray, k: int, allowed: np.ndarray) -> np.ndarray:
+    # Top-k restricted to `allowed` chunk ids (book / chapter / pages).
+    # A plain selector search comes back short on approximate indexes
+    # when the scope is narrow, so IVF probes the scope's lists and
+    # small HNSW scopes are scored exactly.
+    ids = index_ids(index)
+    ivf = faiss.try_extract_index_ivf(index)
+    hnsw = getattr(base_index(index), "hnsw", None)
+
+    if ids is not None and ivf is not None:
+        return ivf_scope_search(index, ids, q_vecs, k, allowed)
+
+    if ids is not None and hnsw is not None:
+        if len(allowed) <= FILTER_EXACT_RATIO * index.ntotal:
+            # Only ids present in the index can be reconstructed
+            return exact_scope_search(index, q_vecs, k, allowed[np.isin(allowed, ids)])
+
+    selector = faiss.IDSelectorBatch(allowed)
+    params = filtered_search_params(index, selector)
+    return index.search(q_vecs, k, params=params)[1]
+
+
+def read_index(path: str, index_type: str = INDEX_TYPE) -> faiss.Index:
+    # With INDEX_MMAP the vector codes stay in the OS page cache and are
+    # shared by every process that opens the file (Streamlit workers).
+    flags = 0
+    if INDEX_MMAP:
+        if index_type.startswith("ivf"):
+            flags = faiss.IO_FLAG_MMAP  # inverted lists
+        else:
+            flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+    index = faiss.read_index(path, flags)
+    apply_search_params(index)
+
+    # id → inverted list lookup for scoped searches
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and index_ids(index) is not None:
+        ivf.make_direct_map()
+    return index
+
+
+# -------- Recall vs Latency Report --------
+def report_queries(vectors: np.ndarray, model) -> Tuple[np.ndarray, int]:
+    with open(EVAL_QUESTIONS_PATH, "r", encoding="utf-8") as f:
+        questions = [item["question"] for item in json.load(f)]
+
+    q_eval = model.encode(
+        questions,
+        convert_to_numpy=True,
+        normalize_embeddings=True
+    ).astype("float32")
+
+    rng = np.random.default_rng(0)
+    sample = rng.choice(
+        len(vectors), size=min(INDEX_REPORT_SAMPLES, len(vectors)), replace=False
+    )
+
+    return np.vstack([q_eval, vectors[sample]]), len(q_eval)
+
+
+def measure(index: faiss.Index, queries: np.ndarray, k: int):
+    # Per-query latency: the app searches one row at a time
+    start = time.perf_counter()
+    rows = [index.search(queries[i:i + 1], k)[1][0] for i in range(len(queries))]
+    elapsed = time.perf_counter() - start
+
+    return np.vstack(rows), 1000 * elapsed / len(queries)
+
+
+def report_variants() -> List[Tuple[str, str]]:
+    variants = []
+    for index_type in INDEX_TYPES:
+        dtypes = ["float32"] if index_type == "ivf_pq" else list(VECTOR_DTYPES)
+        variants.extend((index_type, dtype) for dtype in dtypes)
+    return variants
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray, k: int) -> float:
+    return float(np.mean([
+        len(set(a[a >= 0]) & set(b)) / k for a, b in zip(found, truth)
+    ]))
+
+
+def compare_indexes(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    n_eval: int,
+    k: int = TOP_K
+) -> List[Dict]:
+    results = []
+    truth = None
+
+    for index_type, vector_dtype in report_variants():
+        start = time.perf_counter()
+        index = build_index(vectors, index_type, vector_dtype)
+        build_s = time.perf_counter() - start
+
+        found, latency_ms = measure(index, queries, k)
+        if truth is None:
+            truth = found  # flat float32 is exact: the baseline
+
+        recall = recall_at_k(found, truth, k)
+        # Eval questions alone: quality loss on real queries
+        eval_recall = recall_at_k(found[:n_eval], truth[:n_eval], k)
+
+        results.append({
+            "index_type": index_type,
+            "vector_dtype": vector_dtype,
+            f"recall@{k}": round(recall, 4),
+            f"eval_recall@{k}": round(eval_recall, 4),
+            "latency_ms": round(latency_ms, 4),
+            "build_s": round(build_s, 2),
+            "size_mb": round(len(faiss.serialize_index(index)) / 2**20, 2)
+        })
+        logger.info(
+            f"{index_type:9s} {vector_dtype:8s} recall@{k}={recall:.4f} "
+            f"eval_recall@{k}={eval_recall:.4f} "
+            f"latency={latency_ms:.3f} ms/query build={build_s:.1f}s"
+        )
+
+    return results
+
+
+def write_report(vectors: np.ndarray, model) -> List[Dict]:
+    queries, n_eval = report_queries(vectors, model)
+    results = compare_indexes(vectors, queries, n_eval)
+
+    with open(INDEX_REPORT_PATH, "w", encoding="utf-8") as f:
+        json.dump({
+            "chunks": len(vectors),
+            "queries": len(queries),
+            "eval_queries": n_eval,
+            "k": TOP_K,
+            "results": results
+        }, f, indent=2)
+
+    logger.info(f"Index report written to {INDEX_REPORT_PATH}")
+    return results
+
+
+if __name__ == "__main__":
+    from sentence_transformers import SentenceTransformer
+    from src.embeddings.cache import EmbeddingCache
+    from src.embeddings.embedder import embed_texts
+    from src.utils.records import iter_records
+
+    chunks_path = CHUNKS_JSONL_PATH if CHUNKS_FORMAT == "jsonl" else CHUNKS_PATH
+    texts = [c["text"] for c in iter_records(chunks_path)]
+
+    cache = EmbeddingCache(EMBED_CACHE_PATH, EMBED_MODEL, normalize=True)
+    try:
+        vectors = embed_texts(texts, cache)
+    finally:
+        cache.close()
+
+    write_report(vectors, SentenceTransformer(EMBED_MODEL))
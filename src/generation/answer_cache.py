@@ -0,0 +1,265 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config.settings import (
+    ANSWER_CACHE_PATH,
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_TTL,
+    ANSWER_CACHE_SIMILARITY,
+    EMBED_MODEL,
+    GEMINI_MODEL,
+    LLM_PROVIDER
+)
+from src.generation.llm import PROMPT_VERSION
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class AnswerCache:
+    # Persistent answer cache in two layers:
+    #   exact    key = sha256(model, prompt version, query, chunk ids)
+    #   semantic cosine(query embedding, cached query embedding) >= similarity,
+    #            among entries with the same model, prompt, embedding model
+    #            and retrieved chunk ids (i.e. the same context)
+    # Entries expire after `ttl` seconds; beyond `max_size` the least
+    # recently used are evicted. max_size <= 0 disables the cache.
+    # Empty answers are never stored.
+
+    def __init__(
+        self,
+        path: str = ANSWER_CACHE_PATH,
+        model_name: str = GEMINI_MODEL,
+        prompt_version: int = PROMPT_VERSION,
+        max_size: int = ANSWER_CACHE_SIZE,
+        ttl: float = ANSWER_CACHE_TTL,
+        similarity: float = ANSWER_CACHE_SIMILARITY,
+        embed_model: str = EMBED_MODEL
+    ):
+        self.path = path
+        self.model_name = model_name
+        self.prompt_version = prompt_version
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity = similarity
+        self.embed_model = embed_model
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Shared by the app's script threads; every access holds the lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " prompt_version INTEGER NOT NULL,"
+            " query TEXT NOT NULL,"
+            " embed_model TEXT NOT NULL,"
+            " dim INTEGER NOT NULL,"
+            " vector BLOB,"
+            " answer TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " chunks TEXT)"
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(answers)")}
+        if "chunks" not in columns:
+            # Older caches: their entries stay exact-match only
+            self.conn.execute("ALTER TABLE answers ADD COLUMN chunks TEXT")
+        self.conn.commit()
+
+        # In-memory query vectors for the semantic layer, grouped by
+        # chunk set: chunks key -> {entry key: vector}
+        self._vectors: Dict[str, Dict[str, np.ndarray]] = {}
+        self._chunks_of: Dict[str, str] = {}
+        with self._lock:
+            self._load_vectors()
+            self._evict()
+
+    def key(self, norm_query: str, chunk_ids: List[int]) -> str:
+        h = hashlib.sha256()
+        h.update(f"{self.model_name}\0{self.prompt_version}\0".encode("utf-8"))
+        h.update(norm_query.encode("utf-8"))
+        h.update(np.asarray(sorted(chunk_ids), dtype=np.int64).tobytes())
+        return h.hexdigest()
+
+    @staticmethod
+    def chunks_key(chunk_ids: List[int]) -> str:
+        # Stable ids only survive unchanged text, so the same set means
+        # the same context even across index rebuilds
+        return hashlib.sha256(
+            np.asarray(sorted(chunk_ids), dtype=np.int64).tobytes()
+        ).hexdigest()
+
+    # ---------- Lookup ----------
+    def get(
+        self,
+        norm_query: str,
+        chunk_ids: List[int],
+        query_vec: Optional[np.ndarray] = None
+    ) -> Optional[str]:
+        if self.max_size <= 0:
+            return None
+
+        now = time.time()
+        with self._lock:
+            answer = self._fetch(self.key(norm_query, chunk_ids), now)
+            if answer is not None:
+                self.exact_hits += 1
+                return answer
+
+            candidates = self._vectors.get(self.chunks_key(chunk_ids))
+            if query_vec is not None and candidates:
+                keys = list(candidates)
+                sims = np.stack([candidates[k] for k in keys]) @ np.asarray(query_vec, dtype=np.float32)
+                best = int(np.argmax(sims))
+                if sims[best] >= self.similarity:
+                    answer = self._fetch(keys[best], now)
+                    if answer is not None:
+                        self.semantic_hits += 1
+                        return answer
+
+            self.misses += 1
+            return None
+
+    def _fetch(self, key: str, now: float) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT answer, created FROM answers WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or now - row[1] > self.ttl:
+            return None
+
+        self.conn.execute(
+            "UPDATE answers SET last_used = ? WHERE key = ?", (now, key)
+        )
+        self.conn.commit()
+        return row[0]
+
+    # ---------- Insert / Evict ----------
+    def put(
+        self,
+        norm_query: str,
+        chunk_ids: List[int],
+        answer: str,
+        query_vec: Optional[np.ndarray] = None
+    ):
+        if self.max_size <= 0 or not answer.strip():
+            return
+
+        vec = None if query_vec is None else np.ascontiguousarray(query_vec, dtype=np.float32)
+        key = self.key(norm_query, chunk_ids)
+        chunks = self.chunks_key(chunk_ids)
+        now = time.time()
+
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO answers "
+                "(key, model, prompt_version, query, embed_model, dim, vector, answer, created, last_used, chunks) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    self.model_name,
+                    self.prompt_version,
+                    norm_query,
+                    self.embed_model,
+                    0 if vec is None else int(vec.shape[0]),
+                    None if vec is None else vec.tobytes(),
+                    answer,
+                    now,
+                    now,
+                    chunks
+                )
+            )
+            self.conn.commit()
+            self._forget(key)
+            if vec is not None:
+                self._remember(key, chunks, vec)
+            self._evict()
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl
+        stale = self.conn.execute(
+            "SELECT key FROM answers WHERE created < ? OR key NOT IN ("
+            " SELECT key FROM answers ORDER BY last_used DESC LIMIT ?)",
+            (cutoff, max(self.max_size, 0))
+        ).fetchall()
+        if not stale:
+            return
+
+        self.conn.executemany("DELETE FROM answers WHERE key = ?", stale)
+        self.conn.commit()
+        for (key,) in stale:
+            self._forget(key)
+
+    # ---------- Semantic index (in memory) ----------
+    def _remember(self, key: str, chunks: str, vec: np.ndarray):
+        self._vectors.setdefault(chunks, {})[key] = vec
+        self._chunks_of[key] = chunks
+
+    def _forget(self, key: str):
+        chunks = self._chunks_of.pop(key, None)
+        if chunks is not None:
+            group = self._vectors[chunks]
+            del group[key]
+            if not group:
+                del self._vectors[chunks]
+
+    def _load_vectors(self):
+        # Once at startup; put() and _evict() keep it in sync afterwards
+        rows = self.conn.execute(
+            "SELECT key, chunks, dim, vector FROM answers "
+            "WHERE model = ? AND prompt_version = ? AND embed_model = ?"
+            " AND vector IS NOT NULL AND chunks IS NOT NULL",
+            (self.model_name, self.prompt_version, self.embed_model)
+        ).fetchall()
+
+        for key, chunks, dim, blob in rows:
+            self._remember(key, chunks, np.frombuffer(blob, dtype=np.float32, count=dim))
+
+    # ---------- Metrics ----------
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def stats(self) -> Dict:
+        hits = self.exact_hits + self.semantic_hits
+        total = hits + self.misses
+        return {
+            "size": len(self),
+            "max_size": self.max_size,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0
+        }
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+# -------------------------------------------------
+# Process-wide shared instance
+# -------------------------------------------------
+_shared: Optional[AnswerCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                # Provider in the key: mock answers never reach real users
+                _shared = AnswerCache(model_name=f"{LLM_PROVIDER}:{GEMINI_MODEL}")
+    return _shared
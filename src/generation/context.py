@@ -0,0 +1,112 @@
+from typing import Dict, List
+
+from config.settings import (
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_CHARS_PER_TOKEN,
+    CONTEXT_MIN_OVERLAP
+)
+from src.utils.logger import get_logger
+from src.utils.tracing import traced
+
+logger = get_logger(__name__)
+
+
+# -------- Token Estimate --------
+def estimate_tokens(text: str) -> int:
+    # No local tokenizer for GEMINI_MODEL: a character-based estimate
+    return -(-len(text) // CONTEXT_CHARS_PER_TOKEN)
+
+
+def truncate(text: str, token_budget: int) -> str:
+    cut = text[:token_budget * CONTEXT_CHARS_PER_TOKEN]
+    if len(cut) < len(text) and " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut
+
+
+# -------- Overlap Removal --------
+def overlap_words(prev: List[str], words: List[str]) -> int:
+    # Longest suffix of prev that is also a prefix of words
+    if not prev or not words:
+        return 0
+
+    for start in range(len(prev) - min(len(prev), len(words)), len(prev)):
+        if prev[start] == words[0] and prev[start:] == words[:len(prev) - start]:
+            return len(prev) - start
+    return 0
+
+
+def split_segments(chunks: List[Dict]) -> List[Dict]:
+    # Chunks in reading order → segments. A segment that continues the
+    # previous chunk (same chapter, shared window overlap) keeps only its
+    # new words in "tail"; "full" is used when it stands alone.
+    segments = []
+    prev, prev_words = None, None
+
+    for c in chunks:
+        words = c["text"].split()
+
+        shared = 0
+        if prev is not None and (c["book"], c["chapter_id"]) == (prev["book"], prev["chapter_id"]):
+            shared = overlap_words(prev_words, words)
+
+        joined = shared >= CONTEXT_MIN_OVERLAP
+        segments.append({
+            "rank": c.get("rank", len(segments)),
+            "full": c["text"].strip(),
+            # Poems never overlap, so their line breaks survive
+            "tail": " ".join(words[shared:]) if joined else c["text"].strip(),
+            "joined": joined
+        })
+        prev, prev_words = c, words
+
+    return segments
+
+
+# -------- Context Builder --------
+@traced("context.build")
+def build_context(chunks: List[Dict], token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    segments = split_segments(chunks)
+    if not segments:
+        return ""
+
+    # -------- Pack by relevance --------
+    chosen = set()
+    used = 0
+
+    for i in sorted(range(len(segments)), key=lambda i: segments[i]["rank"]):
+        seg = segments[i]
+        # Upper bound: the tail only applies if the predecessor is in
+        joined = seg["joined"] and (i - 1) in chosen
+        cost = estimate_tokens(seg["tail"] if joined else seg["full"])
+
+        if used + cost <= token_budget:
+            chosen.add(i)
+            used += cost
+        elif not chosen:
+            # The best hit alone exceeds the budget: keep its start
+            seg["full"] = truncate(seg["full"], token_budget)
+            chosen.add(i)
+            used = token_budget
+
+    # -------- Merge contiguous segments into passages --------
+    passages = []
+    for i in sorted(chosen):
+        seg = segments[i]
+        if seg["joined"] and (i - 1) in chosen:
+            passages[-1]["parts"].append(seg["tail"])
+            passages[-1]["rank"] = min(passages[-1]["rank"], seg["rank"])
+        else:
+            passages.append({"parts": [seg["full"]], "rank": seg["rank"]})
+
+    # Most relevant passage first
+    passages.sort(key=lambda p: p["rank"])
+    context = "\n\n".join(
+        " ".join(part for part in p["parts"] if part) for p in passages
+    )
+
+    logger.info(
+        f"Context: {len(chunks)} chunks → {len(passages)} passages, "
+        f"~{estimate_tokens(context)}/{token_budget} tokens"
+    )
+    return context
@@ -1,11 +1,54 @@
-from google import genai
-from config.settings import GEMINI_API_KEY, GEMINI_MODEL
+import threading
+import time
+from typing import Dict, Iterator
 
-client = genai.Client(api_key=GEMINI_API_KEY)
+from config.settings import GEMINI_MODEL, LLM_PROVIDER, require_gemini_api_key
+from src.utils.tracing import observe, traced
 
+_clients: Dict[str, object] = {}
+_client_lock = threading.Lock()
 
-def generate_answer(context: str, query: str) -> str:
-    prompt = f"""
+
+# -------- Providers --------
+# A provider builds a client exposing models.generate_content(model,
+# contents) and models.generate_content_stream(model, contents), i.e.
+# the google-genai surface. Everything below only uses those two calls.
+def make_genai_client():
+    from google import genai
+    return genai.Client(api_key=require_gemini_api_key())
+
+
+def make_mock_client():
+    # Offline backend with configurable latency / token rate
+    from src.generation.mock_llm import MockClient
+    return MockClient()
+
+
+PROVIDERS = {
+    "google-genai": make_genai_client,
+    "mock": make_mock_client,
+}
+
+
+def get_client(provider: str = LLM_PROVIDER):
+    # Created on first use: importing this module needs no API key
+    if provider not in PROVIDERS:
+        raise ValueError(
+            f"Unknown LLM_PROVIDER '{provider}' (expected one of {list(PROVIDERS)})"
+        )
+    if provider not in _clients:
+        with _client_lock:
+            if provider not in _clients:
+                _clients[provider] = PROVIDERS[provider]()
+    return _clients[provider]
+
+
+# Bump whenever the prompt below changes: cached answers are keyed on it
+PROMPT_VERSION = 1
+
+
+def build_prompt(context: str, query: str) -> str:
+    return f"""
 You are a Harry Potter book-accurate assistant.
 
 Rules:
@@ -23,11 +66,34 @@ Question:
 """
 
 
-
-    response = client.models.generate_content(
+# `client` defaults to the shared client of LLM_PROVIDER; any object with
+# the same two models.* methods can stand in for it.
+@traced("llm.generate")
+def generate_answer(context: str, query: str, client=None) -> str:
+    response = (client or get_client()).models.generate_content(
         model=GEMINI_MODEL,
-        contents=prompt
+        contents=build_prompt(context, query)
     )
 
     return response.text.strip()
 
+
+def stream_answer(context: str, query: str, client=None) -> Iterator[str]:
+    # Yields text deltas as Gemini produces them
+    start = time.perf_counter()
+    first = True
+
+    stream = (client or get_client()).models.generate_content_stream(
+        model=GEMINI_MODEL,
+        contents=build_prompt(context, query)
+    )
+
+    for chunk in stream:
+        # Safety / finish-reason chunks carry no text
+        if chunk.text:
+            if first:
+                observe("llm.ttft", time.perf_counter() - start)
+                first = False
+            yield chunk.text
+
+    observe("llm.stream", time.perf_counter() - start)
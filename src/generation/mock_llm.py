@@ -0,0 +1,58 @@
+import re
+import time
+from typing import Iterator
+
+from config.settings import (
+    MOCK_LLM_LATENCY,
+    MOCK_LLM_TOKENS_PER_S,
+    MOCK_LLM_ANSWER_TOKENS
+)
+
+# Words per streamed chunk (Gemini streams a few dozen tokens at a time)
+STREAM_CHUNK_TOKENS = 16
+
+
+class MockResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class MockModels:
+    # Mirrors client.models of google-genai: a fixed wait before the
+    # first token, then `tokens_per_s`. The answer is context words, so
+    # prompt size still shows up in what is returned.
+
+    def __init__(self, latency: float, tokens_per_s: float, answer_tokens: int):
+        self.latency = latency
+        self.tokens_per_s = tokens_per_s
+        self.answer_tokens = answer_tokens
+
+    def answer_words(self, contents: str):
+        context = contents.split("Context:", 1)[-1].split("Question:", 1)[0]
+        words = re.findall(r"\S+", context)[:self.answer_tokens]
+        return words or ["(empty", "context)"]
+
+    def generate_content_stream(self, model: str, contents: str) -> Iterator[MockResponse]:
+        words = self.answer_words(contents)
+        time.sleep(self.latency)
+
+        for start in range(0, len(words), STREAM_CHUNK_TOKENS):
+            part = words[start:start + STREAM_CHUNK_TOKENS]
+            if start:
+                time.sleep(len(part) / self.tokens_per_s)
+            yield MockResponse(" ".join(part) + " ")
+
+    def generate_content(self, model: str, contents: str) -> MockResponse:
+        return MockResponse("".join(
+            chunk.text for chunk in self.generate_content_stream(model, contents)
+        ).strip())
+
+
+class MockClient:
+    def __init__(
+        self,
+        latency: float = MOCK_LLM_LATENCY,
+        tokens_per_s: float = MOCK_LLM_TOKENS_PER_S,
+        answer_tokens: int = MOCK_LLM_ANSWER_TOKENS
+    ):
+        self.models = MockModels(latency, tokens_per_s, answer_tokens)
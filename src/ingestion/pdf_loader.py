@@ -1,15 +1,28 @@
+import hashlib
 import json
 import os
 import re
+import time
 import pdfplumber
-from typing import List, Dict
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pdfminer.pdftypes import resolve1
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
 
 from config.settings import (
-    PDF_PATH,
+    PDF_SOURCE,
     PAGES_PATH,
-    BOOK_SEQUENCE
+    PAGES_JSONL_PATH,
+    PAGES_FORMAT,
+    PAGES_CHECKPOINT_PATH,
+    PAGES_MANIFEST_PATH,
+    BOOK_SEQUENCE,
+    INGEST_WORKERS,
+    INGEST_CHECKPOINT_PAGES
 )
 from src.utils.logger import get_logger
+from src.utils.records import write_records
+from src.utils.tracing import observe, span, traced
 
 logger = get_logger(__name__)
 
@@ -18,99 +31,427 @@ CHAPTER_PATTERN = re.compile(r"^CHAPTER\s+\w+", re.IGNORECASE)
 CHAPTER_ONE_PATTERN = re.compile(r"^CHAPTER\s+ONE$", re.IGNORECASE)
 
 
-def validate_output_file():
-    if os.path.exists(PAGES_PATH):
-        try:
-            with open(PAGES_PATH, "r", encoding="utf-8") as f:
-                json.load(f)
-            raise RuntimeError(
-                "pages.json already exists and is valid. "
-                "Delete it manually to regenerate."
-            )
-        except json.JSONDecodeError:
-            raise RuntimeError(
-                "pages.json exists but is corrupted. "
-                "Delete it before re-running ingestion."
-            )
+# ---------- Input Discovery ----------
+def list_pdf_files(source: str = PDF_SOURCE) -> List[str]:
+    if os.path.isdir(source):
+        pdf_paths = sorted(
+            os.path.join(source, name)
+            for name in os.listdir(source)
+            if name.lower().endswith(".pdf")
+        )
+    elif os.path.exists(source):
+        pdf_paths = [source]
+    else:
+        pdf_paths = []
 
+    if not pdf_paths:
+        raise FileNotFoundError(f"PDF not found: {source}")
 
-def load_pdf_pages() -> List[Dict]:
-    pages = []
+    return pdf_paths
 
-    if not os.path.exists(PDF_PATH):
-        raise FileNotFoundError(f"PDF not found: {PDF_PATH}")
 
-    validate_output_file()
+# ---------- Hashing ----------
+def hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
 
-    current_book = None
-    current_chapter = None
-    book_index = -1
 
-    logger.info(f"Loading PDF: {PDF_PATH}")
+def hash_sources(pdf_paths: List[str]) -> str:
+    h = hashlib.sha256()
+    for path in pdf_paths:
+        h.update(os.path.basename(path).encode())
+        h.update(hash_file(path).encode())
+    return h.hexdigest()
+
 
+def hash_page_content(page) -> Optional[str]:
+    # Hash the raw content streams: far cheaper than extract_text()
+    # and changes whenever the text drawn on the page changes.
     try:
-        with pdfplumber.open(PDF_PATH) as pdf:
-            for idx, page in enumerate(pdf.pages):
-                page_no = idx + 1
+        h = hashlib.sha256()
+        h.update(repr(page.page_obj.mediabox).encode())
+        for stream in page.page_obj.contents:
+            h.update(resolve1(stream).get_data())
+        return h.hexdigest()
+    except Exception:
+        return None
+
+
+# ---------- Checkpoint ----------
+class PageCheckpoint:
+    # Append-only JSONL of extracted pages. Only (hash, byte offset) per
+    # page is held in memory; text is read back from disk when reused.
+
+    def __init__(self, path: str = PAGES_CHECKPOINT_PATH):
+        self.path = path
+        self.index: Dict[Tuple[str, int], Tuple[str, int]] = {}
+        self.live: Dict[Tuple[str, int], int] = {}
+        self._load_index()
+        self._reader = open(self.path, "rb") if os.path.exists(self.path) else None
+        self._writer = open(self.path, "ab")
+
+    def _load_index(self):
+        if not os.path.exists(self.path):
+            return
+
+        offset = 0
+        good_end = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    key = (record["source"], record["page_no"])
+                    self.index[key] = (record["page_hash"], offset)
+                    good_end = offset + len(line)
+                except (ValueError, KeyError):
+                    pass
+                offset += len(line)
+
+        # Drop a torn last line left by an interrupted run
+        if good_end < offset:
+            with open(self.path, "r+b") as f:
+                f.truncate(good_end)
+
+        if self.index:
+            logger.info(f"Resuming with {len(self.index)} checkpointed pages")
+
+    def known_hashes(self, source: str, start: int, end: int) -> Dict[int, str]:
+        hashes = {}
+        for page_no in range(start + 1, end + 1):
+            entry = self.index.get((source, page_no))
+            if entry and entry[0]:
+                hashes[page_no] = entry[0]
+        return hashes
+
+    def read_text(self, source: str, page_no: int) -> Optional[str]:
+        _, offset = self.index[(source, page_no)]
+        self._reader.seek(offset)
+        self.live[(source, page_no)] = offset
+        return json.loads(self._reader.readline())["text"]
+
+    def append(self, records: List[Dict]):
+        if not records:
+            return
+
+        for record in records:
+            offset = self._writer.tell()
+            key = (record["source"], record["page_no"])
+            self._writer.write(
+                (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+            )
+            self.live[key] = offset
+
+        self._writer.flush()
+        os.fsync(self._writer.fileno())
+
+    def close(self):
+        if self._reader:
+            self._reader.close()
+        self._writer.close()
+
+    def compact(self):
+        # Keep only the records used by this run (streamed, not loaded)
+        self.close()
+        temp_path = self.path + ".tmp"
+
+        offset = 0
+        with open(self.path, "rb") as src, open(temp_path, "wb") as dst:
+            for line in src:
+                try:
+                    record = json.loads(line)
+                    key = (record["source"], record["page_no"])
+                    if self.live.get(key) == offset:
+                        dst.write(line)
+                except (ValueError, KeyError):
+                    pass
+                offset += len(line)
 
+        os.replace(temp_path, self.path)
+
+
+# ---------- Manifest ----------
+def load_manifest() -> Optional[Dict]:
+    if not os.path.exists(PAGES_MANIFEST_PATH):
+        return None
+
+    try:
+        with open(PAGES_MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        return None
+
+
+def save_manifest(pdf_hash: str, output_path: str, page_count: int, failed_pages: int = 0):
+    temp_path = PAGES_MANIFEST_PATH + ".tmp"
+
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "pdf_hash": pdf_hash,
+            "output": os.path.basename(output_path),
+            "pages": page_count,
+            "failed_pages": failed_pages
+        }, f, indent=2)
+
+    os.replace(temp_path, PAGES_MANIFEST_PATH)
+
+
+def is_output_current(pdf_hash: str, output_path: str) -> bool:
+    # Outputs are written via temp file + os.replace, so an existing
+    # file is complete; the manifest says which inputs produced it.
+    # An output with failed pages is never current: the next run
+    # retries them (the other pages come from the checkpoint).
+    if not os.path.exists(output_path):
+        return False
+
+    manifest = load_manifest()
+    return (
+        manifest is not None
+        and manifest.get("pdf_hash") == pdf_hash
+        and manifest.get("output") == os.path.basename(output_path)
+        and not manifest.get("failed_pages", 0)
+    )
+
+
+# ---------- Page Extraction (worker-safe) ----------
+def extract_page_range(
+    pdf_path: str,
+    start: int,
+    end: int,
+    known_hashes: Dict[int, str]
+) -> List[Dict]:
+    # Runs in a worker process: every worker opens its own handle,
+    # pdfplumber objects cannot be shared across processes.
+    results = []
+    source = os.path.basename(pdf_path)
+
+    with pdfplumber.open(pdf_path) as pdf:
+        for idx in range(start, end):
+            page_no = idx + 1
+            page = pdf.pages[idx]
+            page_hash = hash_page_content(page)
+
+            record = {
+                "source": source,
+                "page_no": page_no,
+                "page_hash": page_hash,
+                "text": None,
+                "error": None,
+                "cached": False
+            }
+
+            if page_hash is not None and known_hashes.get(page_no) == page_hash:
+                record["cached"] = True
+            else:
                 try:
-                    text = page.extract_text()
+                    record["text"] = page.extract_text()
                 except Exception as e:
-                    logger.warning(f"Page {page_no}: extraction failed ({e})")
-                    continue
-
-                if not text or not text.strip():
-                    # Image-only page → ignore here
-                    continue
-
-                text = text.strip()
-                lines = [l.strip() for l in text.splitlines() if l.strip()]
-
-                # ---------- Chapter Detection ----------
-                if lines and CHAPTER_PATTERN.match(lines[0]):
-                    chapter_header = lines[0]
-
-                    # ✅ BOOK CHANGE LOGIC (CORRECT)
-                    if CHAPTER_ONE_PATTERN.match(chapter_header):
-                        book_index += 1
-                        if book_index >= len(BOOK_SEQUENCE):
-                            logger.warning(
-                                f"Extra CHAPTER ONE detected at page {page_no}"
-                            )
-                        else:
-                            current_book = BOOK_SEQUENCE[book_index]
-                            logger.info(
-                                f"New book detected: {current_book} (page {page_no})"
-                            )
-
-                    # Chapter title may span two lines
-                    current_chapter = (
-                        f"{chapter_header}: {lines[1]}"
-                        if len(lines) > 1 else chapter_header
-                    )
+                    record["error"] = str(e)
+
+            # Release pdfplumber's per-page object caches
+            page.close()
+            results.append(record)
+
+    return results
+
+
+def timed_extract(*task) -> Tuple[float, List[Dict]]:
+    # Worker processes have their own histograms: the timing travels
+    # back with the pages and is recorded by the parent.
+    start = time.perf_counter()
+    results = extract_page_range(*task)
+    return time.perf_counter() - start, results
+
+
+def resolve_timed(timed: Tuple[float, List[Dict]], checkpoint: PageCheckpoint) -> List[Dict]:
+    seconds, results = timed
+    observe("ingest.extract_range", seconds)
+    return resolve_range(results, checkpoint)
+
+
+def split_page_ranges(total_pages: int, workers: int) -> List[Tuple[int, int]]:
+    # Several small ranges per worker keep the pool balanced when
+    # some books are denser than others; ranges are also the unit
+    # of checkpointing, so they never exceed INGEST_CHECKPOINT_PAGES.
+    if total_pages == 0:
+        return []
+
+    n_ranges = max(
+        workers * 4,
+        -(-total_pages // max(1, INGEST_CHECKPOINT_PAGES))
+    )
+    n_ranges = max(1, min(total_pages, n_ranges))
+    size = -(-total_pages // n_ranges)
 
+    return [
+        (start, min(start + size, total_pages))
+        for start in range(0, total_pages, size)
+    ]
+
+
+def resolve_range(results: List[Dict], checkpoint: PageCheckpoint) -> List[Dict]:
+    fresh = []
+
+    for record in results:
+        if record.pop("cached"):
+            record["text"] = checkpoint.read_text(
+                record["source"], record["page_no"]
+            )
+        elif record["error"] is None:
+            fresh.append(record)
+
+    # Failed pages are never checkpointed so they are retried next run
+    checkpoint.append(fresh)
+
+    return results
+
+
+def iter_raw_pages(
+    pdf_paths: List[str],
+    workers: int,
+    checkpoint: PageCheckpoint
+) -> Iterator[Dict]:
+    tasks = []
+    for pdf_path in pdf_paths:
+        with pdfplumber.open(pdf_path) as pdf:
+            total_pages = len(pdf.pages)
+
+        source = os.path.basename(pdf_path)
+        ranges = split_page_ranges(total_pages, workers)
+        logger.info(
+            f"Extracting {total_pages} pages from {source} "
+            f"with {workers} workers ({len(ranges)} ranges)"
+        )
+        tasks.extend(
+            (pdf_path, start, end, checkpoint.known_hashes(source, start, end))
+            for start, end in ranges
+        )
+
+    if workers <= 1:
+        for task in tasks:
+            yield from resolve_timed(timed_extract(*task), checkpoint)
+        return
+
+    # Bounded in-flight window: finished ranges never pile up in memory
+    # faster than the consumer writes them out.
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(timed_extract, *task))
+            if len(pending) >= workers * 2:
+                yield from resolve_timed(pending.popleft().result(), checkpoint)
+
+        # Ranges are consumed in submission order, which is page order.
+        while pending:
+            yield from resolve_timed(pending.popleft().result(), checkpoint)
+
+
+# ---------- Book / Chapter State Machine ----------
+def iter_books_and_chapters(
+    raw_pages: Iterable[Dict],
+    failed: Optional[List[Dict]] = None
+) -> Iterator[Dict]:
+    # Pages that failed to extract are skipped and, if given, listed in `failed`
+    current_book = None
+    current_chapter = None
+    book_index = -1
+
+    for raw in raw_pages:
+        page_no = raw["page_no"]
+        text = raw["text"]
+
+        if raw["error"] is not None:
+            logger.warning(f"Page {page_no}: extraction failed ({raw['error']})")
+            if failed is not None:
+                failed.append({"source": raw["source"], "page_no": page_no})
+            continue
+
+        if not text or not text.strip():
+            # Image-only page → ignore here
+            continue
+
+        text = text.strip()
+        lines = [l.strip() for l in text.splitlines() if l.strip()]
+
+        # ---------- Chapter Detection ----------
+        if lines and CHAPTER_PATTERN.match(lines[0]):
+            chapter_header = lines[0]
+
+            # ✅ BOOK CHANGE LOGIC (CORRECT)
+            if CHAPTER_ONE_PATTERN.match(chapter_header):
+                book_index += 1
+                if book_index >= len(BOOK_SEQUENCE):
+                    logger.warning(
+                        f"Extra CHAPTER ONE detected at page {page_no}"
+                    )
+                else:
+                    current_book = BOOK_SEQUENCE[book_index]
                     logger.info(
-                        f"Chapter detected: {current_chapter} (page {page_no})"
+                        f"New book detected: {current_book} (page {page_no})"
                     )
 
-                pages.append({
-                    "page_no": page_no,
-                    "book": current_book,
-                    "chapter": current_chapter,
-                    "text": text
-                })
+            # Chapter title may span two lines
+            current_chapter = (
+                f"{chapter_header}: {lines[1]}"
+                if len(lines) > 1 else chapter_header
+            )
+
+            logger.info(
+                f"Chapter detected: {current_chapter} (page {page_no})"
+            )
+
+        yield {
+            "page_no": page_no,
+            "book": current_book,
+            "chapter": current_chapter,
+            "text": text,
+            "source": raw["source"]
+        }
+
 
-        if not pages:
+def stream_pdf_pages(
+    pdf_paths: Optional[List[str]] = None,
+    workers: int = INGEST_WORKERS,
+    failed: Optional[List[Dict]] = None
+) -> Iterator[Dict]:
+    pdf_paths = pdf_paths or list_pdf_files()
+    checkpoint = PageCheckpoint()
+    count = 0
+
+    try:
+        # Pass 1 (parallel): raw text extraction, order-independent
+        # Pass 2 (sequential, cheap): book / chapter assignment
+        raw_pages = iter_raw_pages(pdf_paths, workers, checkpoint)
+        for page in iter_books_and_chapters(raw_pages, failed):
+            count += 1
+            yield page
+
+        if not count:
             raise RuntimeError("No text pages extracted.")
 
-        logger.info(f"Successfully extracted {len(pages)} pages")
-        return pages
+        # Drop records for pages that no longer exist
+        checkpoint.compact()
+        logger.info(f"Successfully extracted {count} pages")
 
     except Exception:
         logger.exception("PDF ingestion failed")
         raise
 
+    finally:
+        checkpoint.close()
+
+
+def load_pdf_pages(
+    pdf_paths: Optional[List[str]] = None,
+    workers: int = INGEST_WORKERS,
+    failed: Optional[List[Dict]] = None
+) -> List[Dict]:
+    return list(stream_pdf_pages(pdf_paths, workers, failed))
 
+
+# ---------- Output ----------
 def save_pages(pages: List[Dict]):
     try:
         temp_path = PAGES_PATH + ".tmp"
@@ -126,10 +467,50 @@ def save_pages(pages: List[Dict]):
         raise
 
 
+def save_pages_jsonl(pages: Iterable[Dict]) -> int:
+    # One page per line, written as extracted: memory stays flat
+    count = write_records(pages, PAGES_JSONL_PATH)
+    logger.info(f"pages.jsonl written to {PAGES_JSONL_PATH}")
+    return count
+
+
+@traced("ingest.total")
+def run(
+    source: str = PDF_SOURCE,
+    workers: int = INGEST_WORKERS,
+    output_format: str = PAGES_FORMAT
+):
+    pdf_paths = list_pdf_files(source)
+    output_path = PAGES_JSONL_PATH if output_format == "jsonl" else PAGES_PATH
+
+    with span("ingest.hash"):
+        pdf_hash = hash_sources(pdf_paths)
+
+    if is_output_current(pdf_hash, output_path):
+        logger.info("PDF unchanged since last ingestion. Skipping.")
+        return
+
+    logger.info(f"Loading {len(pdf_paths)} PDF(s) from {source}")
+
+    failed: List[Dict] = []
+    if output_format == "jsonl":
+        count = save_pages_jsonl(stream_pdf_pages(pdf_paths, workers, failed))
+    else:
+        pages = load_pdf_pages(pdf_paths, workers, failed)
+        save_pages(pages)
+        count = len(pages)
+
+    if failed:
+        logger.warning(
+            f"{len(failed)} page(s) failed to extract and are missing from "
+            f"the output; the next run retries them"
+        )
+    save_manifest(pdf_hash, output_path, count, len(failed))
+
+
 if __name__ == "__main__":
     logger.info("Running pdf_loader")
 
-    pages = load_pdf_pages()
-    save_pages(pages)
+    run()
 
     logger.info("PDF loading completed")
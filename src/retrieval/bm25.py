@@ -0,0 +1,167 @@
+import json
+import os
+import re
+from array import array
+from collections import Counter
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from config.settings import BM25_DIR, BM25_K1, BM25_B
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# -------------------------------------------------
+# On-disk layout (one directory)
+#   vocab.json        term → term id
+#   term_offsets.npy  int64[V + 1]  postings range of each term
+#   post_doc.npy      int32[P]      doc numbers, grouped by term
+#   post_tf.npy       uint16[P]     term frequency per posting
+#   doc_ids.npy       int64[N]      doc number → chunk_id
+#   doc_len.npy       float32[N]    tokens per doc
+# -------------------------------------------------
+
+# Very common words: long postings, almost no signal
+STOPWORDS = frozenset("""
+a an and are as at be been but by did do does for from had has have he her
+him his how i in into is it its me my no not of on or our she so than that
+the their them then there they this to was we were what when where which who
+whom why will with would you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    # Same folding as normalize_query: lowercase, drop digits, letters only
+    text = re.sub(r"\d", "", text.lower())
+    return [t for t in re.findall(r"[a-z]+", text) if t not in STOPWORDS]
+
+
+def save_array(bm25_dir: str, name: str, values: np.ndarray):
+    path = os.path.join(bm25_dir, f"{name}.npy")
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, values)
+    os.replace(path + ".tmp", path)
+
+
+def build_bm25(ids: np.ndarray, texts: List[str], bm25_dir: str = BM25_DIR) -> int:
+    os.makedirs(bm25_dir, exist_ok=True)
+
+    vocab = {}
+    term_col = array("i")
+    doc_col = array("i")
+    tf_col = array("H")
+    doc_len = np.zeros(len(texts), dtype=np.float32)
+
+    for doc, text in enumerate(texts):
+        counts = Counter(tokenize(text))
+        doc_len[doc] = sum(counts.values())
+        for term, tf in counts.items():
+            term_col.append(vocab.setdefault(term, len(vocab)))
+            doc_col.append(doc)
+            tf_col.append(min(tf, 0xFFFF))
+
+    terms = np.frombuffer(term_col, dtype=np.int32)
+    # Group postings by term; docs stay ascending inside each term
+    order = np.argsort(terms, kind="stable")
+    term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    term_offsets[1:] = np.cumsum(np.bincount(terms, minlength=len(vocab)))
+
+    save_array(bm25_dir, "term_offsets", term_offsets)
+    save_array(bm25_dir, "post_doc", np.frombuffer(doc_col, dtype=np.int32)[order])
+    save_array(bm25_dir, "post_tf", np.frombuffer(tf_col, dtype=np.uint16)[order])
+    save_array(bm25_dir, "doc_ids", np.asarray(ids, dtype=np.int64))
+    save_array(bm25_dir, "doc_len", doc_len)
+
+    vocab_path = os.path.join(bm25_dir, "vocab.json")
+    with open(vocab_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(vocab, f)
+    os.replace(vocab_path + ".tmp", vocab_path)
+
+    logger.info(
+        f"BM25 index written to {bm25_dir} "
+        f"({len(texts)} docs, {len(vocab)} terms, {len(terms)} postings)"
+    )
+    return len(vocab)
+
+
+class BM25Index:
+    # Memory-mapped postings: a query reads only its own terms' postings,
+    # so cost follows their document frequency, not the corpus size.
+
+    def __init__(self, bm25_dir: str = BM25_DIR, k1: float = BM25_K1, b: float = BM25_B):
+        def load(name):
+            return np.load(os.path.join(bm25_dir, f"{name}.npy"), mmap_mode="r")
+
+        self.term_offsets = load("term_offsets")
+        self.post_doc = load("post_doc")
+        self.post_tf = load("post_tf")
+        self.doc_ids = load("doc_ids")
+        self.doc_len = load("doc_len")
+
+        with open(os.path.join(bm25_dir, "vocab.json"), "r", encoding="utf-8") as f:
+            self.vocab = json.load(f)
+
+        self.k1 = k1
+        self.b = b
+        self.n_docs = len(self.doc_ids)
+        self.avg_len = float(np.mean(self.doc_len)) if self.n_docs else 0.0
+
+    @classmethod
+    def exists(cls, bm25_dir: str = BM25_DIR) -> bool:
+        return os.path.exists(os.path.join(bm25_dir, "vocab.json"))
+
+    def search(
+        self,
+        norm_query: str,
+        k: int,
+        allowed_ids: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # Returns (chunk_ids, scores), best first. allowed_ids (sorted)
+        # drops other documents from the postings before scoring.
+        term_ids = {self.vocab[t] for t in tokenize(norm_query) if t in self.vocab}
+        if not term_ids or not self.avg_len:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        docs, scores = [], []
+        for term_id in term_ids:
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            doc = np.asarray(self.post_doc[start:end])
+            tf = np.asarray(self.post_tf[start:end], dtype=np.float32)
+            df = end - start
+
+            if allowed_ids is not None:
+                member = np.isin(self.doc_ids[doc], allowed_ids, assume_unique=True)
+                doc, tf = doc[member], tf[member]
+
+            idf = np.log1p((self.n_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len[doc] / self.avg_len)
+
+            docs.append(doc)
+            scores.append(idf * tf * (self.k1 + 1) / (tf + norm))
+
+        docs = np.concatenate(docs)
+        if not len(docs):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        uniq, inverse = np.unique(docs, return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(scores))
+
+        k = min(k, len(uniq))
+        top = np.argpartition(-totals, k - 1)[:k]
+        top = top[np.argsort(-totals[top], kind="stable")]
+
+        return np.asarray(self.doc_ids[uniq[top]]), totals[top].astype(np.float32)
+
+
+if __name__ == "__main__":
+    from config.settings import CHUNKS_PATH, CHUNKS_JSONL_PATH, CHUNKS_FORMAT
+    from src.utils.records import iter_records
+
+    chunks_path = CHUNKS_JSONL_PATH if CHUNKS_FORMAT == "jsonl" else CHUNKS_PATH
+    ids, texts = [], []
+    for c in iter_records(chunks_path):
+        ids.append(c["chunk_id"])
+        texts.append(c["text"])
+
+    build_bm25(np.asarray(ids, dtype=np.int64), texts)
@@ -0,0 +1,265 @@
+import json
+import os
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from config.settings import (
+    CHUNKS_PATH,
+    CHUNKS_JSONL_PATH,
+    CHUNKS_FORMAT,
+    CHUNK_STORE_DIR
+)
+from src.utils.logger import get_logger
+from src.utils.records import iter_records
+
+logger = get_logger(__name__)
+
+# -------------------------------------------------
+# On-disk layout (one directory)
+#   text.bin        utf-8 chunk texts, concatenated
+#   offsets.npy     int64[n + 1] byte offsets into text.bin
+#   chunk_id.npy    int64[n]   stable ids (FAISS ids), not row numbers
+#   id_order.npy    int64[n]   rows sorted by chunk_id (id → row lookup)
+#   id_sorted.npy   int64[n]   chunk_id[id_order]
+#   book_id.npy     int16[n]   index into meta["books"], -1 = None
+#   chapter_id.npy  int32[n]   0-based chapter index within its book
+#   chapter_idx.npy int32[n]   index into meta["chapters"] (global)
+#   page_no.npy     int32[n]
+#   chapter_start.npy int64[n_chapters + 1]  first row of each chapter
+#   meta.json       book names + chapter titles
+# -------------------------------------------------
+# Bump when the layout changes: older stores are rebuilt on open
+STORE_VERSION = 2
+
+ARRAYS = {
+    "offsets": "q",
+    "chunk_id": "q",
+    "book_id": "h",
+    "chapter_id": "i",
+    "chapter_idx": "i",
+    "page_no": "i",
+}
+
+
+def save_array(store_dir: str, name: str, values: np.ndarray):
+    # Temp file + os.replace: processes that still memory-map the old
+    # file keep a valid mapping while the store is rebuilt.
+    path = os.path.join(store_dir, f"{name}.npy")
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, values)
+    os.replace(path + ".tmp", path)
+
+
+def build_chunk_store(chunks: Iterable[Dict], store_dir: str = CHUNK_STORE_DIR) -> int:
+    os.makedirs(store_dir, exist_ok=True)
+
+    columns = {name: array(code) for name, code in ARRAYS.items()}
+    books: List[Optional[str]] = []
+    book_ids: Dict[Optional[str], int] = {}
+    chapters: List[Dict] = []
+    chapter_key = None
+
+    offset = 0
+    columns["offsets"].append(0)
+
+    temp_text = os.path.join(store_dir, "text.bin.tmp")
+    with open(temp_text, "wb") as f:
+        for c in chunks:
+            data = c["text"].encode("utf-8")
+            f.write(data)
+            offset += len(data)
+
+            book = c["book"]
+            if book is None:
+                book_id = -1
+            else:
+                if book not in book_ids:
+                    book_ids[book] = len(books)
+                    books.append(book)
+                book_id = book_ids[book]
+
+            # Chunks of a chapter are contiguous in chunk order
+            key = (book_id, c["chapter_id"])
+            if key != chapter_key:
+                chapters.append({
+                    "book_id": book_id,
+                    "chapter_id": c["chapter_id"],
+                    "title": c["chapter"]
+                })
+                chapter_key = key
+
+            columns["offsets"].append(offset)
+            columns["chunk_id"].append(c["chunk_id"])
+            columns["book_id"].append(book_id)
+            columns["chapter_id"].append(c["chapter_id"])
+            columns["chapter_idx"].append(len(chapters) - 1)
+            columns["page_no"].append(c["page_no"])
+
+    for name, values in columns.items():
+        save_array(
+            store_dir, name,
+            np.frombuffer(values, dtype=np.dtype(values.typecode))
+        )
+
+    chunk_ids = np.frombuffer(columns["chunk_id"], dtype=np.int64)
+    id_order = np.argsort(chunk_ids, kind="stable").astype(np.int64)
+    save_array(store_dir, "id_order", id_order)
+    save_array(store_dir, "id_sorted", chunk_ids[id_order])
+
+    # Chapters are contiguous: row - chapter_start[chapter_idx] is a
+    # chunk's rank inside its chapter
+    chapter_idx = np.frombuffer(columns["chapter_idx"], dtype=np.int32)
+    chapter_start = np.searchsorted(
+        chapter_idx, np.arange(len(chapters) + 1), side="left"
+    ).astype(np.int64)
+    save_array(store_dir, "chapter_start", chapter_start)
+
+    meta_path = os.path.join(store_dir, "meta.json")
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({
+            "version": STORE_VERSION,
+            "books": books,
+            "chapters": chapters
+        }, f, ensure_ascii=False)
+    os.replace(meta_path + ".tmp", meta_path)
+
+    # text.bin is swapped in last: its presence marks a complete store
+    # (a first build interrupted earlier leaves no text.bin behind)
+    os.replace(temp_text, os.path.join(store_dir, "text.bin"))
+
+    n = len(columns["chunk_id"])
+    logger.info(f"Chunk store written to {store_dir} ({n} chunks)")
+    return n
+
+
+class ChunkStore:
+    # Memory-mapped, columnar view of the chunks. Only the small
+    # book / chapter tables are parsed; text is decoded on access.
+
+    def __init__(self, store_dir: str = CHUNK_STORE_DIR):
+        self.store_dir = store_dir
+
+        def load(name):
+            return np.load(os.path.join(store_dir, f"{name}.npy"), mmap_mode="r")
+
+        self.offsets = load("offsets")
+        self.chunk_id = load("chunk_id")
+        self.book_id = load("book_id")
+        self.chapter_id = load("chapter_id")
+        self.chapter_idx = load("chapter_idx")
+        self.page_no = load("page_no")
+        self.id_order = load("id_order")
+        self.id_sorted = load("id_sorted")
+        self.chapter_start = load("chapter_start")
+
+        text_path = os.path.join(store_dir, "text.bin")
+        if os.path.getsize(text_path):
+            self.text = np.memmap(text_path, dtype=np.uint8, mode="r")
+        else:
+            self.text = np.zeros(0, dtype=np.uint8)
+
+        with open(os.path.join(store_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.books: List[Optional[str]] = meta["books"]
+        self.chapters: List[Dict] = meta["chapters"]
+
+        # Alphabetical rank per book_id (None first) for reading-order sorts
+        ranked = sorted(range(len(self.books)), key=lambda b: self.books[b])
+        self.book_rank = np.zeros(len(self.books) + 1, dtype=np.int64)
+        self.book_rank[np.asarray(ranked, dtype=np.int64) + 1] = np.arange(1, len(ranked) + 1)
+
+        # Chapter table as arrays, for metadata filters
+        self.chapter_book = np.asarray([c["book_id"] for c in self.chapters], dtype=np.int64)
+        self.chapter_num = np.asarray([c["chapter_id"] for c in self.chapters], dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.chunk_id)
+
+    @classmethod
+    def exists(cls, store_dir: str = CHUNK_STORE_DIR) -> bool:
+        meta_path = os.path.join(store_dir, "meta.json")
+        if not os.path.exists(os.path.join(store_dir, "text.bin")):
+            return False
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("version") == STORE_VERSION
+
+    @classmethod
+    def open_or_build(cls, store_dir: str = CHUNK_STORE_DIR) -> "ChunkStore":
+        if not cls.exists(store_dir):
+            chunks_path = (
+                CHUNKS_JSONL_PATH if CHUNKS_FORMAT == "jsonl" else CHUNKS_PATH
+            )
+            logger.info(f"Chunk store missing or outdated, building from {chunks_path}")
+            build_chunk_store(iter_records(chunks_path), store_dir)
+        return cls(store_dir)
+
+    def rows_for_ids(self, ids: np.ndarray) -> np.ndarray:
+        # chunk_id → row by binary search; -1 for unknown ids
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self):
+            return np.full(ids.shape, -1, dtype=np.int64)
+
+        pos = np.clip(np.searchsorted(self.id_sorted, ids), 0, len(self) - 1)
+        rows = np.asarray(self.id_order[pos], dtype=np.int64)
+        return np.where(self.id_sorted[pos] == ids, rows, -1)
+
+    def match_books(self, book: str) -> List[int]:
+        # Case-insensitive substring: "goblet of fire" matches the full title
+        book = book.lower()
+        return [i for i, name in enumerate(self.books) if book in name.lower()]
+
+    def select_rows(
+        self,
+        book: Optional[str] = None,
+        chapter_id: Optional[int] = None,
+        pages: Optional[Tuple[int, int]] = None
+    ) -> np.ndarray:
+        # Book / chapter narrow the chapter table; their rows are contiguous
+        # ranges, so only the page filter reads per-row metadata.
+        keep = np.ones(len(self.chapters), dtype=bool)
+        if book is not None:
+            keep &= np.isin(self.chapter_book, self.match_books(book))
+        if chapter_id is not None:
+            keep &= self.chapter_num == chapter_id
+
+        chapters = np.flatnonzero(keep)
+        rows = np.concatenate([
+            np.arange(self.chapter_start[c], self.chapter_start[c + 1])
+            for c in chapters
+        ]) if len(chapters) else np.zeros(0, dtype=np.int64)
+
+        if pages is not None:
+            page_no = self.page_no[rows]
+            rows = rows[(page_no >= pages[0]) & (page_no <= pages[1])]
+
+        return rows.astype(np.int64)
+
+    def sort_book_rank(self, rows: np.ndarray) -> np.ndarray:
+        # book_id -1 (None) maps to slot 0
+        return self.book_rank[np.asarray(self.book_id[rows], dtype=np.int64) + 1]
+
+    def book_name(self, row: int) -> Optional[str]:
+        book_id = int(self.book_id[row])
+        return None if book_id < 0 else self.books[book_id]
+
+    def get_text(self, row: int) -> str:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return self.text[start:end].tobytes().decode("utf-8")
+
+    def get(self, row: int, text: Optional[str] = None) -> Dict:
+        # Same shape as a chunks.json record
+        return {
+            "chunk_id": int(self.chunk_id[row]),
+            "text": self.get_text(row) if text is None else text,
+            "book": self.book_name(row),
+            "chapter": self.chapters[int(self.chapter_idx[row])]["title"],
+            "chapter_id": int(self.chapter_id[row]),
+            "page_no": int(self.page_no[row])
+        }
+
+
+if __name__ == "__main__":
+    chunks_path = CHUNKS_JSONL_PATH if CHUNKS_FORMAT == "jsonl" else CHUNKS_PATH
+    build_chunk_store(iter_records(chunks_path))
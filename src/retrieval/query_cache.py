@@ -0,0 +1,90 @@
+import atexit
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class LRUCache:
+    # Size-bounded LRU with hit/miss counters. With persist_path the
+    # entries are loaded at start-up and written back at exit / save().
+
+    def __init__(self, max_size: int, persist_path: Optional[str] = None):
+        self.max_size = max_size
+        self.persist_path = persist_path
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        if persist_path:
+            self.load()
+            atexit.register(self.save)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+    # ---------- Persistence ----------
+    def load(self):
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "rb") as f:
+                items = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache {self.persist_path} ({e})")
+            return
+
+        with self._lock:
+            for key, value in items[-self.max_size:] if self.max_size > 0 else []:
+                self._data[key] = value
+        logger.info(f"Loaded {len(self._data)} entries from {self.persist_path}")
+
+    def save(self):
+        if not self.persist_path:
+            return
+        with self._lock:
+            items = list(self._data.items())
+
+        os.makedirs(os.path.dirname(self.persist_path) or ".", exist_ok=True)
+        temp_path = self.persist_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(items, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.persist_path)
@@ -1,38 +1,29 @@
-import json
-import faiss
 import numpy as np
+import os
 import re
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict
+import threading
+from typing import List, Dict, Optional, Tuple
 
 from config.settings import (
-    CHUNKS_PATH,
     FAISS_INDEX_PATH,
+    CHUNK_STORE_DIR,
     TOP_K,
-    EMBED_MODEL
+    EMBED_MODEL,
+    QUERY_CACHE_SIZE,
+    QUERY_CACHE_DIR,
+    QUERY_CACHE_PERSIST,
+    BM25_DIR,
+    HYBRID_SEARCH,
+    HYBRID_CANDIDATES,
+    RRF_K
 )
+from src.retrieval.bm25 import BM25Index
+from src.retrieval.chunk_store import ChunkStore
+from src.retrieval.query_cache import LRUCache
+from src.utils.logger import get_logger
+from src.utils.tracing import span, traced
 
-# -------------------------------------------------
-# Load once (important for speed)
-# -------------------------------------------------
-model = SentenceTransformer(EMBED_MODEL)
-index = faiss.read_index(FAISS_INDEX_PATH)
-
-with open(CHUNKS_PATH, "r", encoding="utf-8") as f:
-    CHUNKS = json.load(f)
-
-# Lookup by chunk_id
-CHUNK_BY_ID = {c["chunk_id"]: c for c in CHUNKS}
-
-# Chapter-wise index
-CHAPTER_MAP = {}
-for c in CHUNKS:
-    key = (c["book"], c["chapter_id"])
-    CHAPTER_MAP.setdefault(key, []).append(c)
-
-# Ensure correct order inside chapter
-for key in CHAPTER_MAP:
-    CHAPTER_MAP[key].sort(key=lambda x: x["page_no"])
+logger = get_logger(__name__)
 
 
 # -------------------------------------------------
@@ -46,85 +37,350 @@ def normalize_query(query: str) -> str:
     return query
 
 
+def file_signature(path: str) -> str:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return "missing"
+    return f"{st.st_mtime_ns}-{st.st_size}"
+
+
 # -------------------------------------------------
-# Neighbor expansion (chapter-safe)
+# Retriever (lazy: nothing is loaded at import)
 # -------------------------------------------------
-def expand_with_neighbors(chunk: Dict, window: int) -> List[Dict]:
-    key = (chunk["book"], chunk["chapter_id"])
-    chapter_chunks = CHAPTER_MAP.get(key, [])
+class Retriever:
+    def __init__(
+        self,
+        index_path: str = FAISS_INDEX_PATH,
+        store_dir: str = CHUNK_STORE_DIR,
+        model_name: str = EMBED_MODEL,
+        top_k: int = TOP_K
+    ):
+        self.index_path = index_path
+        self.store_dir = store_dir
+        self.model_name = model_name
+        self.top_k = top_k
+
+        self._model = None
+        self._index = None
+        self._store = None
+        self._bm25 = None
+        self._bm25_loaded = False
+        self._version = None
+        self._warm = False
+        self._lock = threading.RLock()
+
+        # Keyed on the normalized query: many raw queries share an entry
+        persist = QUERY_CACHE_DIR if QUERY_CACHE_PERSIST else None
+        self.embedding_cache = LRUCache(
+            QUERY_CACHE_SIZE,
+            os.path.join(persist, "embeddings.pkl") if persist else None
+        )
+        self.result_cache = LRUCache(
+            QUERY_CACHE_SIZE,
+            os.path.join(persist, "results.pkl") if persist else None
+        )
+
+    # ---------- Lazy resources ----------
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    # Deferred: importing torch alone costs seconds
+                    from sentence_transformers import SentenceTransformer
+                    logger.info(f"Loading embedding model {self.model_name}")
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    from src.embeddings.index_builder import read_index
+                    logger.info(f"Loading FAISS index {self.index_path}")
+                    self._index = read_index(self.index_path)
+        return self._index
+
+    @property
+    def store(self) -> ChunkStore:
+        # Memory-mapped chunk columns; FAISS ids are chunk_ids
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = ChunkStore.open_or_build(self.store_dir)
+        return self._store
+
+    @property
+    def bm25(self) -> Optional[BM25Index]:
+        # None when hybrid search is off or the postings were never built
+        if not self._bm25_loaded:
+            with self._lock:
+                if not self._bm25_loaded:
+                    if HYBRID_SEARCH and BM25Index.exists(BM25_DIR):
+                        self._bm25 = BM25Index(BM25_DIR)
+                    elif HYBRID_SEARCH:
+                        logger.warning(
+                            f"No BM25 index in {BM25_DIR}, using vector search only"
+                        )
+                    self._bm25_loaded = True
+        return self._bm25
+
+    def disk_version(self) -> str:
+        # index.faiss is replaced last by the embedder (BM25 just before
+        # it), text.bin last by the chunk store: together they change
+        # whenever anything retrieval reads is rewritten.
+        return "/".join((
+            file_signature(self.index_path),
+            file_signature(os.path.join(self.store_dir, "text.bin"))
+        ))
+
+    def refresh(self) -> str:
+        # Version of the resources in memory; on a change on disk they
+        # are dropped and lazily reloaded, so cached results are never
+        # computed from a stale index under a new version key.
+        version = self.disk_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    if self._version is not None:
+                        logger.info("Index or chunk store changed on disk, reloading")
+                    self._index = None
+                    self._store = None
+                    self._bm25 = None
+                    self._bm25_loaded = False
+                    self._version = version
+        return version
+
+    def cache_stats(self) -> Dict:
+        return {
+            "embeddings": self.embedding_cache.stats(),
+            "results": self.result_cache.stats()
+        }
+
+    def warmup(self) -> "Retriever":
+        # Load everything and run one query so the first user request
+        # does not pay for model load / first forward pass. Idempotent.
+        if not self._warm:
+            self.refresh()
+            self.store
+            self.index
+            self.bm25
+            self.encode(["warmup"])
+            self._warm = True
+        return self
+
+    # ---------- Encoding ----------
+    def encode(self, queries: List[str]) -> np.ndarray:
+        return self.model.encode(
+            queries,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        ).astype("float32")
+
+    def encode_cached(self, norm_queries: List[str]) -> np.ndarray:
+        vectors = [self.embedding_cache.get((self.model_name, q)) for q in norm_queries]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+
+        if missing:
+            # Distinct misses only, in one batched forward pass
+            todo = list(dict.fromkeys(norm_queries[i] for i in missing))
+            encoded = dict(zip(todo, self.encode(todo)))
+            for q, vec in encoded.items():
+                self.embedding_cache.put((self.model_name, q), vec)
+            for i in missing:
+                vectors[i] = encoded[norm_queries[i]]
+
+        return np.vstack(vectors)
+
+    # ---------- Neighbor expansion (chapter-safe) ----------
+    def expand_with_neighbors(self, hits: np.ndarray, window: int) -> np.ndarray:
+        # All hits at once: a (hits x 2·window+1) grid of candidate rows,
+        # clipped to each hit's chapter via the precomputed chapter starts.
+        store = self.store
+        chapter = store.chapter_idx[hits]
+        lo = store.chapter_start[chapter]
+        hi = store.chapter_start[chapter + 1]
+
+        # Columns by distance from the hit: 0, -1, +1, -2, +2, ...
+        offsets = np.arange(-window, window + 1)
+        offsets = offsets[np.argsort(np.abs(offsets), kind="stable")]
+
+        grid = hits[:, None] + offsets[None, :]
+        inside = (grid >= lo[:, None]) & (grid < hi[:, None])
+        # Column-major: all hits (fused order), then their nearest
+        # neighbors, and so on, i.e. rows come out in relevance order
+        rows = grid.T[inside.T]
 
-    idx = next(
-        (i for i, c in enumerate(chapter_chunks)
-         if c["chunk_id"] == chunk["chunk_id"]),
-        None
-    )
+        # Deduplicate, keeping each row's first occurrence
+        _, first = np.unique(rows, return_index=True)
+        return rows[np.sort(first)]
 
-    if idx is None:
-        return [chunk]
+    # ---------- Metadata filters ----------
+    def allowed_ids(
+        self,
+        book: Optional[str] = None,
+        chapter: Optional[int] = None,
+        pages: Optional[Tuple[int, int]] = None
+    ) -> Optional[np.ndarray]:
+        # Sorted chunk_ids in scope; None = no filter. chapter is the
+        # 1-based chapter number (CHAPTER ONE = 1), chapter_id is 0-based.
+        if book is None and chapter is None and pages is None:
+            return None
+        chapter_id = chapter - 1 if chapter is not None else None
+        rows = self.store.select_rows(book=book, chapter_id=chapter_id, pages=pages)
+        return np.sort(np.asarray(self.store.chunk_id[rows], dtype=np.int64))
 
-    start = max(0, idx - window)
-    end = min(len(chapter_chunks), idx + window + 1)
+    def search(self, q_vecs: np.ndarray, k: int, allowed: Optional[np.ndarray]) -> np.ndarray:
+        if allowed is None:
+            return self.index.search(q_vecs, k)[1]
 
-    return chapter_chunks[start:end]
+        # Scope applied inside the search, not on a larger top-K
+        from src.embeddings.index_builder import scoped_search
+
+        return scoped_search(self.index, q_vecs, k, allowed)
+
+    # ---------- Hybrid fusion ----------
+    def fuse(
+        self,
+        norm_query: str,
+        vector_ids: np.ndarray,
+        allowed: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        # Reciprocal rank fusion of FAISS and BM25 candidates: ranks, not
+        # raw scores, so cosine and BM25 scales never need calibrating.
+        vector_ids = vector_ids[vector_ids >= 0]
+        if self.bm25 is None:
+            return vector_ids[:self.top_k]
+
+        lexical_ids, _ = self.bm25.search(norm_query, HYBRID_CANDIDATES, allowed)
+
+        ids = np.concatenate([vector_ids, lexical_ids])
+        ranks = np.concatenate([np.arange(len(vector_ids)), np.arange(len(lexical_ids))])
+
+        unique, inverse = np.unique(ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=1.0 / (RRF_K + 1 + ranks))
+        return unique[np.argsort(-scores, kind="stable")[:self.top_k]]
+
+    # ---------- Main retrieval ----------
+    def retrieve(
+        self,
+        query: str,
+        book: Optional[str] = None,
+        chapter: Optional[int] = None,
+        pages: Optional[Tuple[int, int]] = None
+    ) -> List[Dict]:
+        return self.retrieve_many([query], book=book, chapter=chapter, pages=pages)[0]
+
+    @traced("retrieve.total")
+    def retrieve_many(
+        self,
+        queries: List[str],
+        book: Optional[str] = None,
+        chapter: Optional[int] = None,
+        pages: Optional[Tuple[int, int]] = None
+    ) -> List[List[Dict]]:
+        # One batched forward pass and one multi-row FAISS search for
+        # all queries; expansion and ordering then run per query.
+        # book (title substring), chapter (1-based number) and pages
+        # (inclusive range) restrict the search to matching chunks.
+        if not queries:
+            return []
+
+        # -------- Normalize query --------
+        with span("retrieve.normalize"):
+            norm_queries = [normalize_query(q) for q in queries]
+
+        # -------- Result cache --------
+        version = self.refresh()
+        scope = (book, chapter, tuple(pages) if pages is not None else None)
+        keys = [
+            (q, version, self.top_k, self.bm25 is not None, scope)
+            for q in norm_queries
+        ]
+        results = [self.result_cache.get(key) for key in keys]
+        missing = [i for i, r in enumerate(results) if r is None]
+
+        allowed = self.allowed_ids(book, chapter, pages) if missing else None
+        if allowed is not None and not len(allowed):
+            # Nothing in scope: only the uncached queries come back empty
+            logger.warning(f"No chunks match filter {scope}")
+            for i in missing:
+                results[i] = []
+            missing = []
+
+        if missing:
+            miss_queries = [norm_queries[i] for i in missing]
+
+            # -------- Embed query --------
+            with span("retrieve.encode"):
+                q_vecs = self.encode_cached(miss_queries)
+
+            # -------- Semantic search --------
+            # Deeper candidate list when it is going to be fused
+            k = max(self.top_k, HYBRID_CANDIDATES) if self.bm25 is not None else self.top_k
+            with span("retrieve.search"):
+                indices = self.search(q_vecs, k, allowed)
+
+            for i, norm_query, ids in zip(missing, miss_queries, indices):
+                # -------- Lexical search + fusion --------
+                with span("retrieve.lexical"):
+                    ids = self.fuse(norm_query, ids, allowed)
+                results[i] = self.assemble(ids)
+                self.result_cache.put(keys[i], results[i])
+
+        # Copies: callers may annotate chunks without touching the cache
+        return [[dict(c) for c in chunks] for chunks in results]
+
+    def assemble(self, ids: np.ndarray) -> List[Dict]:
+        store = self.store
+
+        hits = store.rows_for_ids(ids)
+        hits = hits[hits >= 0]
+
+        # -------- Adaptive window --------
+        # Emergent facts need more context
+        window = 3 if len(hits) < 5 else 2
+
+        with span("retrieve.expand"):
+            rows = self.expand_with_neighbors(hits, window=window)
+
+        # -------- Final ordering --------
+        # Reading order (book, chapter_id, page_no, row); lexical
+        # matching is done by the BM25 channel, before expansion.
+        with span("retrieve.sort"):
+            order = np.lexsort((
+                rows,
+                store.page_no[rows],
+                store.chapter_id[rows],
+                store.sort_book_rank(rows)
+            ))
+
+            # Text is only decoded for the rows we actually return; "rank" is
+            # the expansion position (0 = best hit), used for context packing
+            return [{**store.get(int(rows[i])), "rank": int(i)} for i in order]
 
 
 # -------------------------------------------------
-# Main retrieval
+# Process-wide shared instance
 # -------------------------------------------------
-def retrieve(query: str) -> List[Dict]:
-    # -------- Normalize query --------
-    norm_query = normalize_query(query)
-
-    # -------- Embed query --------
-    q_vec = model.encode(
-        [norm_query],
-        convert_to_numpy=True,
-        normalize_embeddings=True
-    )
-
-    # -------- Semantic search --------
-    _, indices = index.search(
-        q_vec.astype("float32"),
-        TOP_K
-    )
-
-    hits = [CHUNK_BY_ID[i] for i in indices[0]]
-
-    # -------- Adaptive window --------
-    # Emergent facts need more context
-    window = 3 if len(hits) < 5 else 2
-
-    expanded = []
-    seen = set()
-
-    for chunk in hits:
-        neighbors = expand_with_neighbors(chunk, window=window)
-        for n in neighbors:
-            if n["chunk_id"] not in seen:
-                expanded.append(n)
-                seen.add(n["chunk_id"])
-
-    # -------- Light lexical anchoring (boost exact phrases) --------
-    boosted = []
-    for c in expanded:
-        if norm_query in c["text"].lower():
-            boosted.append(c)
-
-    if boosted:
-        expanded = boosted + [
-            c for c in expanded if c not in boosted
-        ]
+_shared: Optional[Retriever] = None
+_shared_lock = threading.Lock()
+
+
+def get_retriever() -> Retriever:
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = Retriever()
+    return _shared
 
-    # -------- Final ordering --------
-    expanded.sort(
-        key=lambda c: (
-            c["book"],
-            c["chapter_id"],
-            c["page_no"],
-            c["chunk_id"]
-        )
-    )
 
-    return expanded
+def retrieve(query: str, **filters) -> List[Dict]:
+    return get_retriever().retrieve(query, **filters)
 
 
+def retrieve_many(queries: List[str], **filters) -> List[List[Dict]]:
+    return get_retriever().retrieve_many(queries, **filters)
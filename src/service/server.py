@@ -0,0 +1,189 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from config.settings import (
+    SERVICE_HOST,
+    SERVICE_PORT,
+    BATCH_MAX_SIZE,
+    BATCH_MAX_WAIT_MS,
+    SERVICE_MAX_QUEUE,
+    SERVICE_MAX_GENERATIONS
+)
+from src.generation.answer_cache import get_answer_cache
+from src.generation.context import build_context
+from src.generation.llm import generate_answer, stream_answer
+from src.retrieval.retriever import get_retriever, normalize_query
+from src.service.batcher import MicroBatcher, Overloaded
+from src.utils.logger import get_logger
+from src.utils.tracing import render_prometheus
+
+logger = get_logger(__name__)
+
+
+# -------------------------------------------------
+# Request bodies
+# -------------------------------------------------
+class RetrieveRequest(BaseModel):
+    query: str
+    book: Optional[str] = None
+    chapter: Optional[int] = None
+    pages: Optional[Tuple[int, int]] = None
+
+
+class AnswerRequest(RetrieveRequest):
+    stream: bool = False
+
+
+# -------------------------------------------------
+# Batched retrieval
+# -------------------------------------------------
+def retrieve_batch(requests: List[RetrieveRequest]) -> List[List[Dict]]:
+    # One retrieve_many (one encode + one search) per filter scope;
+    # unscoped queries, the common case, all share a single call.
+    groups: Dict[Tuple, List[int]] = {}
+    for i, r in enumerate(requests):
+        groups.setdefault((r.book, r.chapter, r.pages), []).append(i)
+
+    results: List[List[Dict]] = [[] for _ in requests]
+    for (book, chapter, pages), members in groups.items():
+        found = get_retriever().retrieve_many(
+            [requests[i].query for i in members],
+            book=book, chapter=chapter, pages=pages
+        )
+        for i, chunks in zip(members, found):
+            results[i] = chunks
+    return results
+
+
+def overloaded(detail: str) -> HTTPException:
+    return HTTPException(status_code=503, detail=detail, headers={"Retry-After": "1"})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Model / index / chunk store are loaded before the first request
+    await asyncio.to_thread(get_retriever().warmup)
+
+    app.state.batcher = MicroBatcher(
+        retrieve_batch,
+        max_batch=BATCH_MAX_SIZE,
+        max_wait=BATCH_MAX_WAIT_MS / 1000,
+        max_queue=SERVICE_MAX_QUEUE
+    )
+    app.state.generations = asyncio.Semaphore(SERVICE_MAX_GENERATIONS)
+    app.state.batcher.start()
+    logger.info(f"Service ready on {SERVICE_HOST}:{SERVICE_PORT}")
+
+    yield
+
+    await app.state.batcher.stop()
+
+
+app = FastAPI(title="Marauder's Archive", lifespan=lifespan)
+
+
+async def batched_retrieve(request: RetrieveRequest) -> List[Dict]:
+    try:
+        return await app.state.batcher.submit(request)
+    except Overloaded as e:
+        raise overloaded(str(e))
+
+
+# -------------------------------------------------
+# Endpoints
+# -------------------------------------------------
+@app.post("/retrieve")
+async def retrieve_endpoint(request: RetrieveRequest) -> Dict:
+    return {"query": request.query, "chunks": await batched_retrieve(request)}
+
+
+@app.post("/answer")
+async def answer_endpoint(request: AnswerRequest):
+    chunks = await batched_retrieve(request)
+    context = await asyncio.to_thread(build_context, chunks)
+
+    # -------- Answer cache --------
+    norm_query = normalize_query(request.query)
+    chunk_ids = [c["chunk_id"] for c in chunks]
+    # Already in the retriever's embedding cache: no forward pass
+    query_vec = (await asyncio.to_thread(get_retriever().encode_cached, [norm_query]))[0]
+
+    # SQLite lookups / writes run off the event loop
+    cache = get_answer_cache()
+    answer = await asyncio.to_thread(cache.get, norm_query, chunk_ids, query_vec)
+    if answer is not None:
+        if request.stream:
+            return StreamingResponse(iter([answer]), media_type="text/plain")
+        return {"query": request.query, "answer": answer, "cached": True, "chunks": chunks}
+
+    # -------- Generation (bounded) --------
+    # A slot is taken right after checking, with no await in between,
+    # so requests are rejected instead of queued
+    generations: asyncio.Semaphore = app.state.generations
+    if generations.locked():
+        raise overloaded(f"{SERVICE_MAX_GENERATIONS} answers already in progress")
+
+    if request.stream:
+        # The slot is taken inside the generator: a client that leaves
+        # before the body is iterated never holds one. The generator
+        # checks again, since slots may fill up before the body starts.
+        return StreamingResponse(
+            relay_stream(context, request.query, generations, norm_query, chunk_ids, query_vec),
+            media_type="text/plain"
+        )
+
+    async with generations:
+        answer = await asyncio.to_thread(generate_answer, context, request.query)
+
+    await asyncio.to_thread(cache.put, norm_query, chunk_ids, answer, query_vec)
+    return {"query": request.query, "answer": answer, "cached": False, "chunks": chunks}
+
+
+async def relay_stream(context, query, generations, norm_query, chunk_ids, query_vec) -> AsyncIterator[str]:
+    # Pulls deltas from the blocking genai stream in a worker thread; only
+    # a stream that ran to completion is cached.
+    if generations.locked():
+        # Headers are already sent (200): report the overload in the body
+        yield f"[503] {SERVICE_MAX_GENERATIONS} answers already in progress, retry shortly"
+        return
+
+    async with generations:
+        parts = []
+        deltas = stream_answer(context, query)
+        while True:
+            delta = await asyncio.to_thread(next, deltas, None)
+            if delta is None:
+                break
+            parts.append(delta)
+            yield delta
+
+    await asyncio.to_thread(
+        get_answer_cache().put, norm_query, chunk_ids, "".join(parts).strip(), query_vec
+    )
+
+
+@app.get("/health")
+async def health() -> Dict:
+    return {
+        "batcher": app.state.batcher.stats(),
+        "retriever_cache": get_retriever().cache_stats(),
+        "answer_cache": get_answer_cache().stats()
+    }
+
+
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    # Per-stage histograms; empty unless TRACING=1
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # One process: batching only works if queries share an event loop
+    uvicorn.run(app, host=SERVICE_HOST, port=SERVICE_PORT)
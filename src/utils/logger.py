@@ -1,8 +1,28 @@
 import logging
 
+_configured = False
+
+
 def get_logger(name: str):
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s | %(levelname)s | %(message)s"
-    )
+    # Root handler is configured once, not on every module import
+    global _configured
+    if not _configured:
+        logging.basicConfig(
+            level=logging.INFO,
+            format="%(asctime)s | %(levelname)s | %(message)s"
+        )
+        _configured = True
     return logging.getLogger(name)
+
+
+def get_json_logger(name: str):
+    # Machine-readable lines: the bare message, without the root
+    # "asctime | level" prefix
+    json_logger = logging.getLogger(name)
+    if not json_logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        json_logger.addHandler(handler)
+        json_logger.setLevel(logging.INFO)
+        json_logger.propagate = False
+    return json_logger
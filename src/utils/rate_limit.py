@@ -0,0 +1,76 @@
+import random
+import threading
+import time
+from typing import Callable, TypeVar
+
+import httpx
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+# HTTP statuses worth retrying: quota (429) and transient server errors
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    # Thread-safe token bucket: `rate` tokens per second, bursts up to
+    # `capacity`. acquire() blocks until a token is available.
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        if rate <= 0:
+            raise ValueError(f"Token bucket rate must be > 0, got {rate}")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+def is_retryable(error: Exception) -> bool:
+    # google-genai APIError carries the HTTP status as `code`
+    status = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS
+    # google-genai talks HTTP through httpx, whose timeouts / connection
+    # errors are not builtin TimeoutError / ConnectionError subclasses
+    return isinstance(error, (TimeoutError, ConnectionError, httpx.TransportError))
+
+
+def with_backoff(
+    fn: Callable[[], T],
+    max_retries: int,
+    base_delay: float,
+    max_delay: float
+) -> T:
+    # Exponential backoff with full jitter, retryable errors only
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            logger.warning(
+                f"Retryable error ({e}), attempt {attempt + 1}/{max_retries}, "
+                f"sleeping {delay:.1f}s"
+            )
+            time.sleep(delay)
@@ -0,0 +1,98 @@
+import json
+import os
+import textwrap
+from typing import Dict, Iterable, Iterator
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+READ_BLOCK_SIZE = 1 << 16
+
+
+# -------- Lazy Readers --------
+def iter_jsonl(path: str) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_json_array(path: str) -> Iterator[Dict]:
+    # Incremental parse of a top-level JSON array: only the current
+    # read block (plus one partial element) is ever held in memory.
+    decoder = json.JSONDecoder()
+
+    with open(path, "r", encoding="utf-8") as f:
+        buf = f.read(READ_BLOCK_SIZE).lstrip()
+        if not buf.startswith("["):
+            raise ValueError(f"{path} is not a JSON array")
+        pos = 1
+
+        while True:
+            # Skip whitespace / separators, refilling as needed
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+
+            if pos >= len(buf):
+                more = f.read(READ_BLOCK_SIZE)
+                if not more:
+                    raise ValueError(f"{path}: unexpected end of JSON array")
+                buf, pos = more, 0
+                continue
+
+            if buf[pos] == "]":
+                return
+
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                more = f.read(READ_BLOCK_SIZE)
+                if not more:
+                    raise
+                buf, pos = buf[pos:] + more, 0
+                continue
+
+            yield obj
+            pos = end
+
+
+def iter_records(path: str) -> Iterator[Dict]:
+    if path.endswith(".jsonl"):
+        return iter_jsonl(path)
+    return iter_json_array(path)
+
+
+# -------- Streaming Writer --------
+def write_records(records: Iterable[Dict], path: str) -> int:
+    # .json output is byte-identical to json.dump(..., indent=2)
+    temp_path = path + ".tmp"
+    jsonl = path.endswith(".jsonl")
+    count = 0
+
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            if not jsonl:
+                f.write("[")
+
+            for record in records:
+                if jsonl:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                else:
+                    f.write(",\n" if count else "\n")
+                    f.write(textwrap.indent(
+                        json.dumps(record, indent=2, ensure_ascii=False), "  "
+                    ))
+                count += 1
+
+            if not jsonl:
+                f.write("\n]" if count else "]")
+
+        os.replace(temp_path, path)
+        return count
+
+    except Exception:
+        logger.exception(f"Failed to write {path}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
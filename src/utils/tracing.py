@@ -0,0 +1,126 @@
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Callable, Dict
+
+from config.settings import TRACING, TRACE_LOG_JSON, METRICS_PATH
+from src.utils.logger import get_json_logger, get_logger
+
+logger = get_logger(__name__)
+# One JSON object per line, e.g. for a log shipper
+trace_logger = get_json_logger("rag.trace")
+
+# Upper bounds (seconds), from sub-millisecond numpy work to slow LLM calls
+BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last slot: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+_histograms: Dict[str, Histogram] = {}
+_lock = threading.Lock()
+_NOOP = nullcontext()
+
+
+# -------- Recording --------
+def observe(name: str, seconds: float):
+    if not TRACING:
+        return
+
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+    if TRACE_LOG_JSON:
+        trace_logger.info(json.dumps({
+            "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "stage": name,
+            "ms": round(seconds * 1000, 3)
+        }))
+
+
+@contextmanager
+def _timed(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def span(name: str):
+    # Disabled: one shared no-op context manager, no clock reads
+    return _timed(name) if TRACING else _NOOP
+
+
+def traced(name: str) -> Callable:
+    # Disabled: the function is returned untouched
+    def decorate(fn: Callable) -> Callable:
+        if not TRACING:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _timed(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorate
+
+
+# -------- Export --------
+def render_prometheus() -> str:
+    with _lock:
+        snapshot = {
+            name: (list(h.counts), h.sum, h.count)
+            for name, h in _histograms.items()
+        }
+
+    lines = [
+        "# HELP rag_stage_seconds Time spent per pipeline stage.",
+        "# TYPE rag_stage_seconds histogram"
+    ]
+    for name in sorted(snapshot):
+        counts, total, count = snapshot[name]
+        cumulative = 0
+        for bound, n in zip([f"{b:g}" for b in BUCKETS] + ["+Inf"], counts):
+            cumulative += n
+            lines.append(f'rag_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'rag_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+        lines.append(f'rag_stage_seconds_count{{stage="{name}"}} {count}')
+
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path: str = METRICS_PATH):
+    if not _histograms:
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(path + ".tmp", path)
+
+
+if TRACING:
+    # Offline stages (pdf_loader, chunker, embedder) leave their timings
+    atexit.register(write_metrics)
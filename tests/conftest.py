@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# Imports are relative to the repository root, wherever pytest runs from
+ROOT_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT_DIR))
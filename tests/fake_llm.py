@@ -0,0 +1,49 @@
+import threading
+import time
+from typing import List, Optional, Tuple
+
+
+class FakeAPIError(Exception):
+    # Shaped like google-genai's APIError: the HTTP status is `code`
+    def __init__(self, code: int):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModels:
+    # Stand-in for client.models: streams `chunks`, a list of
+    # (delay before the chunk in seconds, chunk text), on every call.
+    # `failures` are raised, in order, by the first calls instead.
+
+    def __init__(self, chunks: List[Tuple[float, str]], failures: Optional[List[Exception]] = None):
+        self.chunks = chunks
+        self.failures = list(failures or [])
+        self.calls = 0
+        self.call_times: List[float] = []
+        self._lock = threading.Lock()
+
+    def generate_content_stream(self, model: str, contents: str):
+        with self._lock:
+            self.calls += 1
+            self.call_times.append(time.monotonic())
+            failure = self.failures.pop(0) if self.failures else None
+        if failure is not None:
+            raise failure
+        for delay, text in self.chunks:
+            time.sleep(delay)
+            yield FakeResponse(text)
+
+    def generate_content(self, model: str, contents: str) -> FakeResponse:
+        return FakeResponse("".join(
+            chunk.text or "" for chunk in self.generate_content_stream(model, contents)
+        ))
+
+
+class FakeClient:
+    def __init__(self, chunks: List[Tuple[float, str]], failures: Optional[List[Exception]] = None):
+        self.models = FakeModels(chunks, failures)
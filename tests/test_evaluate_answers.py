@@ -0,0 +1,91 @@
+import json
+
+import httpx
+import pytest
+
+import evaluation.evaluate_answers as evaluate
+from src.utils.rate_limit import is_retryable
+from tests.fake_llm import FakeAPIError, FakeClient
+
+
+@pytest.fixture
+def questions(tmp_path, monkeypatch):
+    path = tmp_path / "questions.json"
+    path.write_text(json.dumps([
+        {"id": i, "question": f"question {i}", "answer": f"answer {i}"}
+        for i in range(1, 4)
+    ]))
+
+    # No index needed: every question retrieves one fixed chunk
+    monkeypatch.setattr(evaluate, "retrieve_many", lambda queries: [
+        [{"text": "The Burrow", "book": "Chamber", "chapter_id": 0, "rank": 0}]
+        for _ in queries
+    ])
+    monkeypatch.setattr(evaluate, "EVAL_BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(evaluate, "EVAL_BACKOFF_MAX", 0.02)
+    return path
+
+
+def run(questions, tmp_path, client, rpm=6000, workers=2):
+    results = evaluate.evaluate_answers(
+        client=client,
+        results_path=str(tmp_path / "results.jsonl"),
+        rpm=rpm,
+        workers=workers,
+        questions_path=str(questions)
+    )
+    return {r["id"]: r for r in results}
+
+
+def test_quota_errors_are_retried(questions, tmp_path):
+    client = FakeClient([(0.0, "The Burrow")], failures=[FakeAPIError(429), FakeAPIError(503)])
+    results = run(questions, tmp_path, client, workers=1)
+
+    assert all("error" not in r for r in results.values())
+    assert client.models.calls == 3 + 2
+
+
+def test_client_errors_are_not_retried(questions, tmp_path):
+    client = FakeClient([(0.0, "The Burrow")], failures=[FakeAPIError(400)])
+    results = run(questions, tmp_path, client, workers=1)
+
+    assert [r["id"] for r in results.values() if "error" in r] == [1]
+    assert client.models.calls == 3
+
+
+def test_transport_errors_are_retryable():
+    request = httpx.Request("POST", "https://example.invalid")
+    assert is_retryable(httpx.ConnectError("refused", request=request))
+    assert is_retryable(httpx.ReadTimeout("timed out", request=request))
+    assert not is_retryable(ValueError("bad prompt"))
+
+
+def test_requests_share_the_rate_limit(questions, tmp_path):
+    # 600 rpm = one request per 0.1 s, across all workers
+    client = FakeClient([(0.0, "The Burrow")])
+    run(questions, tmp_path, client, rpm=600, workers=3)
+
+    times = client.models.call_times
+    assert len(times) == 3
+    assert times[-1] - times[0] >= 0.18
+
+
+def test_rpm_must_be_positive(questions, tmp_path):
+    with pytest.raises(ValueError):
+        run(questions, tmp_path, FakeClient([(0.0, "x")]), rpm=0)
+
+
+def test_resume_runs_only_missing_and_failed(questions, tmp_path):
+    with open(tmp_path / "results.jsonl", "w", encoding="utf-8") as f:
+        f.write(json.dumps({"id": 1, "question": "question 1", "expected": "answer 1",
+                            "answer": "done", "ttft_s": 0.1, "total_s": 0.2}) + "\n")
+        f.write(json.dumps({"id": 2, "question": "question 2", "expected": "answer 2",
+                            "error": "APIError: 500"}) + "\n")
+        f.write('{"id": 3, "quest')  # torn last line
+
+    client = FakeClient([(0.0, "The Burrow")])
+    results = run(questions, tmp_path, client)
+
+    assert client.models.calls == 2
+    assert results[1]["answer"] == "done"
+    assert results[2]["answer"] == results[3]["answer"] == "The Burrow"
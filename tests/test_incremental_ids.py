@@ -0,0 +1,84 @@
+import shutil
+
+import numpy as np
+import pytest
+
+from src.chunking.chunker import (
+    assign_stable_ids,
+    previous_chunk_ids,
+    save_id_watermark
+)
+from src.retrieval.chunk_store import build_chunk_store
+
+
+def make_chunks(texts):
+    return [
+        {"text": t, "book": "Stone", "chapter": "ONE", "chapter_id": 0, "page_no": 1}
+        for t in texts
+    ]
+
+
+def chunk_run(tmp_path, texts):
+    # One chunker run: assign ids, rebuild the store, persist the mark
+    store_dir = str(tmp_path / "chunk_store")
+    ids_path = str(tmp_path / "chunk_ids.json")
+    hashes_path = str(tmp_path / "index.hashes.npz")
+
+    by_text, next_id = previous_chunk_ids(store_dir, ids_path, hashes_path)
+    chunks = list(assign_stable_ids(make_chunks(texts), by_text, next_id))
+    build_chunk_store(chunks, store_dir)
+    save_id_watermark(max([next_id] + [c["chunk_id"] + 1 for c in chunks]), ids_path)
+    return {c["text"]: c["chunk_id"] for c in chunks}
+
+
+def test_dropped_ids_are_not_recycled(tmp_path):
+    assert chunk_run(tmp_path, ["a", "b", "c"]) == {"a": 0, "b": 1, "c": 2}
+    assert chunk_run(tmp_path, ["a", "b"]) == {"a": 0, "b": 1}
+    assert chunk_run(tmp_path, ["a", "b", "z"]) == {"a": 0, "b": 1, "z": 3}
+
+
+def test_high_water_mark_survives_a_lost_store(tmp_path):
+    chunk_run(tmp_path, ["a", "b", "c"])
+    shutil.rmtree(tmp_path / "chunk_store")  # e.g. after a STORE_VERSION bump
+
+    assert chunk_run(tmp_path, ["z"]) == {"z": 3}
+
+
+# -------- Index update --------
+def fake_vector(text, dim=8):
+    rng = np.random.default_rng(sum(text.encode("utf-8")))
+    v = rng.standard_normal(dim).astype("float32")
+    return v / np.linalg.norm(v)
+
+
+def test_recycled_id_gets_its_new_vector(tmp_path, monkeypatch):
+    # The embedder imports SentenceTransformer at module level
+    pytest.importorskip("sentence_transformers")
+    import src.embeddings.embedder as embedder
+    from src.embeddings.index_builder import build_index
+
+    monkeypatch.setattr(embedder, "FAISS_HASHES_PATH", str(tmp_path / "index.hashes.npz"))
+    monkeypatch.setattr(embedder, "embed_texts", lambda texts, cache: np.stack(
+        [fake_vector(t) for t in texts]
+    ))
+
+    def update(index, id_texts):
+        ids = np.asarray(list(id_texts), dtype="int64")
+        texts = list(id_texts.values())
+        hashes = embedder.text_hashes(texts)
+        assert embedder.update_index(index, ids, hashes, texts, cache=None)
+        embedder.save_index_hashes(ids, hashes)
+
+    # A → B → C, with an id handed out again by an older chunker
+    ids = np.array([0, 1, 2], dtype="int64")
+    texts = ["a", "b", "c"]
+    index = build_index(np.stack([fake_vector(t) for t in texts]), "flat", ids=ids)
+    embedder.save_index_hashes(ids, embedder.text_hashes(texts))
+
+    update(index, {0: "a", 1: "b"})
+    update(index, {0: "a", 1: "b", 2: "z"})
+    np.testing.assert_allclose(index.reconstruct(2), fake_vector("z"), rtol=1e-6)
+
+    # Same id set, changed text: replaced in place
+    update(index, {0: "a", 1: "b", 2: "c"})
+    np.testing.assert_allclose(index.reconstruct(2), fake_vector("c"), rtol=1e-6)
@@ -0,0 +1,43 @@
+import faiss
+import numpy as np
+import pytest
+
+import src.embeddings.index_builder as index_builder
+
+
+@pytest.fixture
+def corpus():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((3000, 64)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = np.arange(len(vectors), dtype="int64") * 2 + 7  # ids are not rows
+    queries = vectors[:8] + 0.3 * rng.standard_normal((8, 64)).astype("float32")
+    return vectors, ids, queries.astype("float32"), rng
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "hnsw"])
+def test_narrow_scope_returns_exact_top_k(index_type, corpus, tmp_path, monkeypatch):
+    vectors, ids, queries, rng = corpus
+    # Probing one list / a tiny beam is where a plain filter came back short
+    monkeypatch.setattr(index_builder, "IVF_NPROBE", 1)
+    monkeypatch.setattr(index_builder, "HNSW_EF_SEARCH", 16)
+
+    path = str(tmp_path / "index.faiss")
+    faiss.write_index(index_builder.build_index(vectors, index_type, ids=ids), path)
+    index = index_builder.read_index(path, index_type)
+
+    rows = np.sort(rng.choice(len(vectors), 40, replace=False))
+    allowed = ids[rows]
+    truth = allowed[np.argsort(-(queries @ vectors[rows].T), axis=1)[:, :10]]
+
+    found = index_builder.scoped_search(index, queries, 10, allowed)
+    np.testing.assert_array_equal(found, truth)
+
+
+def test_scope_smaller_than_k_is_padded(corpus):
+    vectors, ids, queries, _ = corpus
+    index = index_builder.build_index(vectors, "hnsw", ids=ids)
+
+    found = index_builder.scoped_search(index, queries, 10, ids[:3])
+    assert set(found[0][:3]) == set(ids[:3])
+    assert (found[:, 3:] == -1).all()
@@ -0,0 +1,31 @@
+from evaluation.evaluate_answers import timed_answer
+from src.generation.llm import generate_answer, stream_answer
+from tests.fake_llm import FakeClient
+
+
+def test_stream_yields_deltas_in_order():
+    client = FakeClient([(0.0, "The "), (0.0, "Boy "), (0.0, "Who Lived")])
+    assert list(stream_answer("context", "question", client=client)) == [
+        "The ", "Boy ", "Who Lived"
+    ]
+
+
+def test_stream_skips_chunks_without_text():
+    # Safety / finish-reason chunks carry no text
+    client = FakeClient([(0.0, None), (0.0, "Hagrid"), (0.0, ""), (0.0, " said")])
+    assert list(stream_answer("context", "question", client=client)) == ["Hagrid", " said"]
+
+
+def test_ttft_is_the_first_non_empty_chunk():
+    client = FakeClient([(0.05, None), (0.10, "Dobby"), (0.20, " is free")])
+    answer, ttft, total = timed_answer("context", "question", client=client)
+
+    assert answer == "Dobby is free"
+    assert 0.15 <= ttft < 0.30
+    assert total >= 0.35
+
+
+def test_generate_answer_uses_the_given_client():
+    client = FakeClient([(0.0, " Expecto "), (0.0, "Patronum ")])
+    assert generate_answer("context", "question", client=client) == "Expecto Patronum"
+    assert client.models.calls == 1